@@ -2,50 +2,121 @@
 
 from cboe_monitor.utilities import \
     DATE_FORMAT, run_over_time_frame, DAILY_UPDATE_HOUR, get_last_day, \
-    mk_notification, mk_notification_params, is_business_day
-from cboe_monitor.data_manager import VIXDataManager, GVZDataManager, OVXDataManager
-from cboe_monitor.schedule_manager import ScheduleManager
-from cboe_monitor.util_http_bs4 import get_content_json
+    mk_notification, mk_notification_params, is_business_day, TradingDayContext, \
+    recover_interrupted_writes, get_file_path, get_trading_calendar, get_cfe_closed_delay
+from cboe_monitor.data_manager import \
+    VIXDataManager, GVZDataManager, OVXDataManager, download_all
+from cboe_monitor.schedule_manager import ScheduleManager, get_scheduler, RETRY_DELAY
+from cboe_monitor.publication_tracker import PublicationScheduleManager
+from cboe_monitor.staged_executor import StagedExecutor
+from cboe_monitor.snapshot_ring import SnapshotRing, SNAPSHOT_RING_FILE, snapshot_to_items
+from cboe_monitor.download_engine import get_download_engine
+from cboe_monitor.util_http_bs4 import get_content
 from cboe_monitor.util_cboe_vix_futures import \
-    check_vix_intraday_warning, check_warning_info_same, VIX_FUTURES_URL, \
-    mk_intraday_notification
+    check_warning_info_same, VIX_FUTURES_URL, \
+    mk_intraday_notification, calc_intraday_ratio, get_intraday_delay, \
+    batch_check_vix_intraday_warning, quotes_to_columns
 from cboe_monitor.util_dingding import send_md_msg
 from cboe_monitor.logger import logger
 from datetime import datetime
-from time import sleep
 
-import argparse
+import argparse, signal, time, json, hashlib
 
 
 #----------------------------------------------------------------------
-class MonitorScheduleManager(ScheduleManager):
+class MonitorScheduleManager(PublicationScheduleManager):
 
     # UTC+8
     _update_hour = DAILY_UPDATE_HOUR
     _crontab = f'50 {_update_hour} * * *'
+    # the daily push goes first
+    _priority = 0
     _last_day = None
     _day_index = None
-    _day_vix_downloaded = False
-    _day_gvz_downloaded = False
-    _day_ovx_downloaded = False
+    _stages = None
+    _stages_day = None
+    _managers = None
+    # the data manager of each stage
+    _stage_classes = {'vix': VIXDataManager, 'gvz': GVZDataManager, 'ovx': OVXDataManager}
+    _stage_names = tuple(_stage_classes)
 
     def __init__(self, immediately: bool = False, push_msg: bool = False):
         """"""
         self._immediately = immediately
         self._push_msg = push_msg
+        self._stages = StagedExecutor()
+        self._managers = {}
         super(MonitorScheduleManager, self).__init__(immediately)
 
-    def do_timeout(self):
+    def get_pending_stages(self):
+        """the names of the stages not done yet"""
+        return [name for name in self._stage_names if not self._stages.is_done(name)]
+
+    def probe_published(self, delivery_dates: list):
+        """probe the urls of the pending stages"""
+        urls = []
+        for name in self.get_pending_stages():
+            cls = self._stage_classes[name]
+            dates = delivery_dates if cls is VIXDataManager else []
+            urls.extend(self.get_data_manager(cls, dates).get_probe_urls())
+        return self.probe_urls(urls)
+
+    def do_attempt(self):
         """"""
         logger.info('start schedule task. ')
-        delivery_dates, schedule_days = run_over_time_frame()
+        delivery_dates, calendar = run_over_time_frame()
         self._last_day = get_last_day(self._update_hour)
         self._day_index = datetime.strftime(self._last_day, DATE_FORMAT)
-        if not is_business_day(self._last_day, schedule_days):
+        if not is_business_day(self._last_day, calendar):
             logger.info('last day is not a business day. ')
             return self.clear_and_return_true()
-        vdm = VIXDataManager(delivery_dates)
-        vdm.download_raw_data(self._day_vix_downloaded)
+        if self._stages_day != self._day_index:
+            # the results of the other day are useless
+            self._stages.clear()
+            self._stages_day = self._day_index
+            # so are the validators of the probes
+            self.reset_probes()
+        if not self.probe_published(delivery_dates):
+            logger.info('data not published yet. ')
+            self.mark_unpublished(self.get_pending_stages())
+            return False
+        self.start_attempt()
+        pending = self.get_pending_stages()
+        trading_days = TradingDayContext(calendar)
+        # the symbols run at the same time, the done ones are kept for the retry
+        done = self._stages.run({'vix': lambda: self.do_vix_stage(delivery_dates, trading_days),
+                                 'gvz': lambda: self.do_gvz_stage(trading_days),
+                                 'ovx': lambda: self.do_ovx_stage(trading_days)})
+        if not self._immediately:
+            # it's not run by the crontab otherwise
+            self.record_publication([name for name in pending if self._stages.is_done(name)],
+                                    self._day_index)
+        if not done:
+            self.mark_unpublished(self.get_pending_stages())
+            return False
+        df, rets_vix = self._stages.get('vix')
+        rets_gvzm = self._stages.get('gvz')
+        rets_ovxm = self._stages.get('ovx')
+        params = mk_notification_params(df, delivery_dates, rets_vix, rets_gvzm, rets_ovxm)
+        title, msg = mk_notification(**params)
+        if self._push_msg:
+            send_md_msg(title, msg)
+        logger.info('schedule task done. ')
+        return self.clear_and_return_true()
+
+    def get_data_manager(self, cls, delivery_dates: list):
+        """the data managers are kept between the runs, so the ini files are
+        parsed once and the analyzed frames stay in memory"""
+        if cls not in self._managers:
+            self._managers[cls] = cls(delivery_dates)
+        mgr = self._managers[cls]
+        mgr.set_delivery_dates(delivery_dates)
+        return mgr
+
+    def do_vix_stage(self, delivery_dates: list, trading_days: TradingDayContext):
+        """download, combine and analyze vix, None if failed"""
+        vdm = self.get_data_manager(VIXDataManager, delivery_dates)
+        download_all([vdm], trading_days)
         df = vdm.combine_all()
         rets_vix = vdm.analyze()
         if rets_vix['vix_diff'].index[-1] != self._day_index or \
@@ -53,41 +124,39 @@ class MonitorScheduleManager(ScheduleManager):
             # vix diff is not pulled, retry 5 minutes later
             logger.info(f"last_day: {self._last_day}, index: {self._day_index}, vix_index: {rets_vix['vix'].index[-1]}, vix_diff_index: {rets_vix['vix_diff'].index[-1]}")
             logger.info("vix info download failed. ")
-            return False
+            return None
         elif df.iloc[-1][0] <= 1 or df.iloc[-1][1] <= 1:
             logger.info(f'vix info download failed due to vix 0 or 1 is zero. ')
-            return False
-        self._day_vix_downloaded = True
+            return None
+        return df, rets_vix
+
+    def do_gvz_stage(self, trading_days: TradingDayContext):
+        """download and analyze gvz, None if failed"""
         # gvz futures are delisted
-        gvzm = GVZDataManager([])
-        gvzm.download_raw_data(self._day_gvz_downloaded)
+        gvzm = self.get_data_manager(GVZDataManager, [])
+        download_all([gvzm], trading_days)
         rets_gvzm = gvzm.analyze()
         if self._day_index not in rets_gvzm['gvz'].index:
             logger.info("gvz info download failed. ")
-            return False
-        self._day_gvz_downloaded = True
+            return None
+        return rets_gvzm
+
+    def do_ovx_stage(self, trading_days: TradingDayContext):
+        """download and analyze ovx, None if failed"""
         # ovx futures are delisted
-        ovxm = OVXDataManager([])
-        ovxm.download_raw_data(self._day_ovx_downloaded)
+        ovxm = self.get_data_manager(OVXDataManager, [])
+        download_all([ovxm], trading_days)
         rets_ovxm = ovxm.analyze()
         if self._day_index not in rets_ovxm['ovx'].index:
             logger.info("ovx info download failed. ")
-            return False
-        self._day_ovx_downloaded = True
-        params = mk_notification_params(df, delivery_dates, rets_vix, rets_gvzm, rets_ovxm)
-        title, msg = mk_notification(**params)
-        if self._push_msg:
-            send_md_msg(title, msg)
-        logger.info('schedule task done. ')
-        return self.clear_and_return_true()
+            return None
+        return rets_ovxm
 
     def clear_and_return_true(self):
         """clear the _day_index and return True"""
         self._last_day = None
         self._day_index = None
-        self._day_vix_downloaded = False
-        self._day_gvz_downloaded = False
-        self._day_ovx_downloaded = False
+        self._stages.clear()
         self._push_msg = True
         self._immediately = False
         return True
@@ -98,32 +167,82 @@ class IntradayScheduleManager(ScheduleManager):
 
     # use interval
     _last_infos = []
-    _counter = 0
+    _jitter = 30
+    # the hash of the last payload
+    _last_hash = None
+    # the max ratio of the contracts' move to the unusual move
+    _ratio = 0
+    _alive_time = None
+    # about 2 days
+    _alive_interval = 2 * 24 * 3600
+    # the snapshots of the polls
+    _ring = None
+
+    def __init__(self, doit: bool = False):
+        """"""
+        self._ring = SnapshotRing(get_file_path(SNAPSHOT_RING_FILE))
+        # the warnings of the last snapshot are not sent again after restarted
+        last_snapshot = self._ring.last_snapshot()
+        if last_snapshot.size > 0:
+            self._last_infos = batch_check_vix_intraday_warning({'data': snapshot_to_items(last_snapshot)})
+        super(IntradayScheduleManager, self).__init__(doit)
 
     def get_delay_time(self):
-        """do it every 900 seconds"""
-        return 900
+        """poll faster when any contract is near the unusual move"""
+        return get_intraday_delay(self._ratio)
+
+    #----------------------------------------------------------------------
+    def timeout(self, doit: bool = True):
+        """poll in the cfe sessions only, the delay is decided after the poll"""
+        paused = get_cfe_closed_delay(get_trading_calendar())
+        if paused > 0:
+            # no quotes changed until the next session
+            self._ratio = 0
+            return self.get_fire_delay(paused)
+        if doit and not self.do_timeout():
+            return self.get_fire_delay(min(RETRY_DELAY, self.get_delay_time()))
+        return self.get_fire_delay()
 
     #----------------------------------------------------------------------
     def do_timeout(self):
         """"""
-        soup = get_content_json(VIX_FUTURES_URL)
-        if False == soup:
+        payload = get_content(VIX_FUTURES_URL, lambda response: response.content)
+        if False == payload:
             logger.info("intraday vix futures info fetch failed. ")
             return False
-        rets = check_vix_intraday_warning(soup)
+        self.log_alive()
+        digest = hashlib.sha1(payload).hexdigest()
+        if digest == self._last_hash:
+            # the quotes are not changed, so is the warning
+            return True
+        try:
+            soup = json.loads(payload)
+        except ValueError:
+            logger.info("intraday vix futures info is broken. ")
+            return False
+        self._last_hash = digest
+        self._ring.append(int(time.time()), soup.get('data', []))
+        # the quotes are converted once for both
+        columns = quotes_to_columns(soup.get('data', []))
+        self._ratio = calc_intraday_ratio(soup, columns = columns)
+        rets = batch_check_vix_intraday_warning(soup, columns = columns)
         if rets != [] and not check_warning_info_same(self._last_infos, rets):
             title, msg = mk_intraday_notification(rets)
             send_md_msg(title, msg)
             logger.info('intraday vix warning msg sended. ')
             self._last_infos = rets
-        self._counter +=1
-        # 192 = 4 * 48, about 2 day
-        if self._counter >= 192:
-            logger.info('intraday monitor is still aliving... ')
-            self._counter = 0
         return True
 
+    #----------------------------------------------------------------------
+    def log_alive(self):
+        """log it's still alive every interval"""
+        now = time.monotonic()
+        if self._alive_time is None:
+            self._alive_time = now
+        elif now - self._alive_time >= self._alive_interval:
+            logger.info('intraday monitor is still aliving... ')
+            self._alive_time = now
+
 
 #----------------------------------------------------------------------
 if __name__ == '__main__':
@@ -133,9 +252,23 @@ if __name__ == '__main__':
     arg_parser.add_argument('--push', type = bool, dest = 'push_msg', default = False,
                             help = 'push the message. ')
     args = arg_parser.parse_args()
+    # the writes interrupted by the last stop are cleaned or redone
+    recover_interrupted_writes()
+    scheduler = get_scheduler()
+
+    def stop_monitor(signum, frame):
+        """stop cleanly when killed, the running downloads are cancelled"""
+        logger.info(f'signal {signum} received, stopping. ')
+        scheduler.stop()
+        get_download_engine().cancel()
+
+    signal.signal(signal.SIGTERM, stop_monitor)
+    signal.signal(signal.SIGINT, stop_monitor)
     mgr = MonitorScheduleManager(args.immediately, args.push_msg)
     logger.info('cboe monitor started. ')
     intraday_mgr = IntradayScheduleManager(True)
     logger.info('cboe intraday monitor started. ')
-    while True:
-        sleep(1)
+    # all the jobs run in the scheduler thread
+    while scheduler.is_running():
+        scheduler.join(1)
+    logger.info('cboe monitor stopped. ')
@@ -0,0 +1,124 @@
+# encoding: UTF-8
+
+from .utilities import CHECK_SECTION, cached_hash_file, atomic_write
+from .logger import logger
+
+import os, json, threading, configparser
+
+
+CHECKSUM_MANIFEST_SUFFIX = '.checksums.jsonl'
+
+
+#----------------------------------------------------------------------
+class ChecksumManifest():
+    """the checksums of the local files
+
+    one json line for each file with the checksum, size, mtime and the source
+    of it. the changes are applied in batches, each batch writes the whole
+    manifest to a temp file, fsyncs then renames it, so the manifest is never
+    torn. the checksums of the old ini file are migrated once."""
+
+    def __init__(self, path: str, ini_path: str = None, data_path: str = None):
+        """Constructor"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._items = {}
+        if os.path.exists(path):
+            self.load()
+        elif ini_path and os.path.exists(ini_path):
+            self.migrate(ini_path, data_path)
+
+    #----------------------------------------------------------------------
+    def load(self):
+        """load the manifest, the broken lines are skipped"""
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    item = json.loads(line)
+                    self._items[item['file']] = item
+                except (ValueError, KeyError, TypeError):
+                    logger.error(f'broken line of {self.path} skipped. ')
+
+    #----------------------------------------------------------------------
+    def migrate(self, ini_path: str, data_path: str = None):
+        """migrate the checksums of the ini file, the files are under the
+        data path"""
+        ini_parser = configparser.ConfigParser()
+        ini_parser.read(ini_path)
+        if CHECK_SECTION not in ini_parser.sections():
+            return
+        if data_path is None:
+            data_path = os.path.splitext(ini_path)[0]
+        # the keys of configparser are lower cased
+        names = {}
+        if os.path.isdir(data_path):
+            names = {name.lower(): name for name in os.listdir(data_path)}
+        # the size and mtime are unknown, the files are hashed at the first check
+        records = [{'file': names.get(key, key), 'checksum': checksum,
+                    'size': None, 'mtime_ns': None, 'source': 'ini'}
+                   for key, checksum in ini_parser.items(CHECK_SECTION)]
+        self.update(records)
+        logger.info(f'{len(records)} checksums migrated from {ini_path} to {self.path}. ')
+
+    #----------------------------------------------------------------------
+    def make_record(self, path: str, checksum: str, source: str = None):
+        """the record of the file, the size and mtime are None if it's missing"""
+        try:
+            stat = os.stat(path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except FileNotFoundError:
+            size, mtime_ns = None, None
+        return {'file': os.path.basename(path), 'checksum': checksum,
+                'size': size, 'mtime_ns': mtime_ns, 'source': source}
+
+    #----------------------------------------------------------------------
+    def get(self, name: str):
+        """the checksum of the file name, None if it's not in the manifest"""
+        with self._lock:
+            item = self._items.get(name)
+        return item['checksum'] if item else None
+
+    #----------------------------------------------------------------------
+    def files(self):
+        """the file names in the manifest"""
+        with self._lock:
+            return sorted(self._items)
+
+    #----------------------------------------------------------------------
+    def is_intact(self, path: str):
+        """check if the local file is the one of the checksum, the file with
+        the same size and mtime is not hashed again"""
+        with self._lock:
+            item = self._items.get(os.path.basename(path))
+        if not item or not item['checksum']:
+            return False
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if item['size'] == stat.st_size and item['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        return cached_hash_file(path) == item['checksum']
+
+    #----------------------------------------------------------------------
+    def update(self, records: list):
+        """apply the records in one batch, the manifest is written only if
+        any of them changed"""
+        with self._lock:
+            changed = False
+            for record in records:
+                if self._items.get(record['file']) != record:
+                    self._items[record['file']] = record
+                    changed = True
+            if changed:
+                self.save()
+        return changed
+
+    #----------------------------------------------------------------------
+    def save(self):
+        """write the manifest atomically, called with the lock held"""
+        def write(tmp_path: str):
+            with open(tmp_path, 'w') as file:
+                for name in sorted(self._items):
+                    file.write(json.dumps(self._items[name], separators = (',', ':')) + '\n')
+        atomic_write(self.path, write)
@@ -1,14 +1,22 @@
 # encoding: UTF-8
 
 from .utilities import \
-    CHECK_SECTION, make_sure_dirs_exist, \
-    get_file_path, generate_csv_checksums, combine_all, \
-    analyze_diff_percent, load_futures_by_csv, load_vix_by_csv, \
-    close_ma5_ma10_ma20, generate_futures_chain
-from .remote_data import RemoteDataFactory, SYNC_DATA_MODE
+    make_sure_dirs_exist, \
+    get_file_path, generate_csv_checksums, combine_contracts, \
+    analyze_diff_percent, load_futures_by_csv, \
+    generate_futures_chain, TradingDayContext
+from .remote_data import RemoteDataFactory, RemoteHttpCBOEData, SYNC_DATA_MODE, \
+    FIX_FILE_PATTERN
+from .futures_store import FuturesStore, FrozenManifest, \
+    FUTURES_STORE_FILE, FROZEN_MANIFEST_FILE
+from .util_http_bs4 import get_session, HttpValidatorCache
+from .checksum_manifest import ChecksumManifest, CHECKSUM_MANIFEST_SUFFIX
+from .download_engine import get_download_engine
+from .result_cache import analysis_cache, files_fingerprint
+from .resident_store import resident_store
 from .logger import logger
 
-import os, logging, configparser, threadpool
+import os, logging
 import pandas as pd
 
 
@@ -23,29 +31,46 @@ class DataManager():
     futures_chain_suffix = ''
     data_path = ''
     ini_path = ''
+    http_cache_path = ''
 
     pool_size = 10
 
     def __init__(self, delivery_dates: list = []):
         """Constructor"""
         self._delivery_dates = delivery_dates
-        self.ini_parser = configparser.ConfigParser()
-        self.ini_parser.read(self.ini_path)
-        self.check_ini()
+        # the manifest is beside the old ini file, it's migrated at the first time
+        checksum_path = os.path.splitext(self.ini_path)[0] + CHECKSUM_MANIFEST_SUFFIX
+        self.checksums = ChecksumManifest(checksum_path, self.ini_path, self.data_path)
+        self._sources = {}
+
+    #----------------------------------------------------------------------
+    def set_delivery_dates(self, delivery_dates: list):
+        """set the delivery dates of the run, the manager is kept between the
+        runs"""
+        self._delivery_dates = delivery_dates
 
     #----------------------------------------------------------------------
     def get_remote_path(self, expiration_date):
         return os.path.join(self.futures_link, expiration_date)
 
     #----------------------------------------------------------------------
-    def download_raw_data(self, downloaded = False):
-        """download the data"""
-        if downloaded is True:
-            return
+    def get_frozen_manifest(self):
+        """the manifest of the frozen contracts"""
+        return FrozenManifest(os.path.join(self.data_path, FROZEN_MANIFEST_FILE))
+
+    #----------------------------------------------------------------------
+    def prepare_download(self, trading_days: TradingDayContext = None):
+        """create the remote data to download, the frozen contracts are
+        skipped"""
         make_sure_dirs_exist(self.data_path)
         logger.info(f'start downloading data from {self.futures_link}')
+        # make sure the shared session keeps a connection for each worker
+        get_session(self.pool_size)
         to_update = []
-        data_fac = RemoteDataFactory(self.data_path, self.ini_parser)
+        self._http_cache = HttpValidatorCache(self.http_cache_path)
+        self._frozen = self.get_frozen_manifest()
+        data_fac = RemoteDataFactory(self.data_path, self.checksums,
+                                     self._http_cache, trading_days)
         for sym in self.symbols:
             rdata = data_fac.create(
                 sym, sym, SYNC_DATA_MODE.HTTP_DOWNLOAD_CBOE)
@@ -63,52 +88,117 @@ class DataManager():
         #         sym, sym, SYNC_DATA_MODE.PANDAS_DATAREADER)
         #     to_update.append(rdata)
         for expiration_date in self._delivery_dates:
+            if self._frozen.is_frozen(expiration_date):
+                continue
             remote_path = self.get_remote_path(expiration_date)
             rdata = data_fac.create(
                 expiration_date, remote_path, SYNC_DATA_MODE.HTTP_DOWNLOAD_FILE)
             # (None, dict_param: dict) for pass parameters by dict
             to_update.append(rdata)
-        # do request in the threadpool
-        requests = threadpool.makeRequests(lambda x: x.sync_data(), to_update)
-        pool = threadpool.ThreadPool(self.pool_size)
-        [pool.putRequest(req) for req in requests]
-        pool.wait()
-        logger.info('all data downloaded. ')
-        checksums = generate_csv_checksums(self.data_path)
+        # the source of each local file for the checksum manifest
+        self._sources = {rdata.get_local_file(): rdata.remote_path for rdata in to_update}
+        return to_update
+
+    #----------------------------------------------------------------------
+    def get_probe_urls(self):
+        """the urls changed when the data of the day is published, the quotes
+        of the symbols and the front contract not frozen, for the cheap probes
+        before the download"""
+        urls = [RemoteHttpCBOEData.quotes_url % FIX_FILE_PATTERN.sub('', sym)
+                for sym in self.symbols]
+        frozen = self.get_frozen_manifest()
+        for expiration_date in self._delivery_dates:
+            if not frozen.is_frozen(expiration_date):
+                urls.append(self.get_remote_path(expiration_date))
+                break
+        return urls
+
+    #----------------------------------------------------------------------
+    def finish_download(self):
+        """save the states after the data downloaded, the newly settled
+        contracts are compacted and frozen"""
+        self._http_cache.save()
+        if self._delivery_dates:
+            store = FuturesStore(os.path.join(self.data_path, FUTURES_STORE_FILE))
+            store.compact(self.data_path)
+            self._frozen.freeze(store, self.data_path)
+        checksums = generate_csv_checksums(self.data_path, self._frozen.file_names())
         # save the local file's checksum
         self.save_checksums(checksums)
 
+    #----------------------------------------------------------------------
+    def download_raw_data(self, downloaded = False):
+        """download the data"""
+        if downloaded is True:
+            return
+        download_all([self])
+
+    #----------------------------------------------------------------------
+    def get_cache_key(self, name: str, *args):
+        """the key of the cached result, it changes with the local files"""
+        return (name, type(self).__name__, tuple(self._delivery_dates)) + args + \
+            (files_fingerprint(self.data_path), )
+
     #----------------------------------------------------------------------
     def combine_all(self, max_times: int = 12):
+        """combine all futures' term structure, it's calculated again only if
+        the local files changed, the frame returned is the copy of the cached
+        one"""
+        self._max_times = max_times
+        term = analysis_cache.get(self.get_cache_key('combine_all', max_times),
+                                  lambda: self.do_combine_all(max_times))
+        self._term = term.copy(deep = False)
+        return self._term
+
+    #----------------------------------------------------------------------
+    def do_combine_all(self, max_times: int = 12):
         """combine all futures' term structure"""
-        self._term = combine_all(self._delivery_dates, self.data_path, max_times)
+        store = FuturesStore(os.path.join(self.data_path, FUTURES_STORE_FILE))
+        # the settled futures are parsed only once
+        store.compact(self.data_path)
+        self._term = combine_contracts(self._delivery_dates,
+                                       store.iter_contracts(self.data_path),
+                                       max_times)
         # drop the first columns of 0, it's useless however
         self._term = self._term[self._term.iloc[:][0] > 0]
         return self._term
 
     #----------------------------------------------------------------------
     def analyze(self):
-        """analyze the data"""
-        raise NotImplementedError
+        """analyze the data, it's analyzed again only if the local files
+        changed, the frames returned are the copies of the cached ones"""
+        rets = analysis_cache.get(
+            self.get_cache_key('analyze', getattr(self, '_max_times', None)),
+            self.do_analyze)
+        return {key: df.copy(deep = False) for key, df in rets.items()}
 
     #----------------------------------------------------------------------
-    def check_ini(self):
-        """check ini"""
-        if CHECK_SECTION not in self.ini_parser.sections():
-            self.ini_parser.add_section(CHECK_SECTION)
-            self.save_ini()
+    def do_analyze(self):
+        """analyze the data"""
+        raise NotImplementedError
 
     #----------------------------------------------------------------------
     def save_checksums(self, checksums: list):
-        """save csv files' checksum to the ini config file"""
-        for csv_name, checksum in checksums:
-            self.ini_parser.set(CHECK_SECTION, csv_name, checksum)
-        self.save_ini()
+        """save csv files' checksum to the manifest in one batch"""
+        records = [self.checksums.make_record(os.path.join(self.data_path, csv_name), checksum,
+                                              self._sources.get(csv_name))
+                   for csv_name, checksum in checksums]
+        self.checksums.update(records)
 
-    #----------------------------------------------------------------------
-    def save_ini(self):
-        """save ini"""
-        self.ini_parser.write(open(self.ini_path, 'w'))
+
+#----------------------------------------------------------------------
+def download_all(managers: list, trading_days: TradingDayContext = None):
+    """download the data of all the managers in one concurrent wave, the
+    trading days are computed once for all"""
+    if trading_days is None:
+        trading_days = TradingDayContext()
+    to_update = []
+    for mgr in managers:
+        to_update.extend(mgr.prepare_download(trading_days))
+    get_download_engine().download(to_update)
+    logger.info('all data downloaded. ')
+    for mgr in managers:
+        mgr.finish_download()
 
 
 #----------------------------------------------------------------------
@@ -118,21 +208,20 @@ class VIXDataManager(DataManager):
     symbols = ['^VIX']
     data_path = get_file_path('vix')
     ini_path = get_file_path('vix.ini')
+    http_cache_path = get_file_path('vix.http.json')
 
     #----------------------------------------------------------------------
     def get_remote_path(self, expiration_date):
         return os.path.join(self.futures_link, "VX_" + expiration_date + ".csv")
 
     #----------------------------------------------------------------------
-    def analyze(self):
+    def do_analyze(self):
         """analyze the data"""
         delta_p = analyze_diff_percent(self._term)
         # drop the first column, it's useless
         delta_p.drop(0, axis = 1, inplace = True)
-        vix = load_vix_by_csv(os.path.join(self.data_path, 'VIX.csv'))
-        vix.dropna(subset = ['Close'], inplace = True)
-        vix.drop(columns = ['Volume'], inplace = True)
-        close_ma5_ma10_ma20(vix)
+        # the resident frame only calculates the new rows
+        vix = resident_store.load(os.path.join(self.data_path, 'VIX.csv'))
         return {'vix_diff': delta_p, 'vix' : vix}
 
 
@@ -149,14 +238,13 @@ class GVZDataManager(DataManager):
     futures_chain_suffix = 'CMX'
     data_path = get_file_path('gvz')
     ini_path = get_file_path('gvz.ini')
+    http_cache_path = get_file_path('gvz.http.json')
 
     #----------------------------------------------------------------------
-    def analyze(self):
+    def do_analyze(self):
         """analyze the data"""
-        gvz = load_vix_by_csv(os.path.join(self.data_path, 'GVZ.csv'))
-        gvz.dropna(subset = ['Close'], inplace = True)
-        gvz.drop(columns = ['Volume'], inplace = True)
-        close_ma5_ma10_ma20(gvz)
+        # the resident frame only calculates the new rows
+        gvz = resident_store.load(os.path.join(self.data_path, 'GVZ.csv'))
         return {'gvz': gvz}
 
 
@@ -172,12 +260,11 @@ class OVXDataManager(DataManager):
     futures_chain_suffix = 'NYM'
     data_path = get_file_path('ovx')
     ini_path = get_file_path('ovx.ini')
+    http_cache_path = get_file_path('ovx.http.json')
 
     #----------------------------------------------------------------------
-    def analyze(self):
+    def do_analyze(self):
         """analyze the data"""
-        ovx = load_vix_by_csv(os.path.join(self.data_path, 'OVX.csv'))
-        ovx.dropna(subset = ['Close'], inplace = True)
-        ovx.drop(columns = ['Volume'], inplace = True)
-        close_ma5_ma10_ma20(ovx)
+        # the resident frame only calculates the new rows
+        ovx = resident_store.load(os.path.join(self.data_path, 'OVX.csv'))
         return {'ovx': ovx}
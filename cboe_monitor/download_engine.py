@@ -0,0 +1,134 @@
+# encoding: UTF-8
+
+from .logger import logger
+
+import asyncio, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+# downloads running at the same time
+DOWNLOAD_CONCURRENCY = 10
+# downloads running at the same time for each host
+DOWNLOAD_HOST_CONCURRENCY = 6
+# seconds for all the downloads of one wave
+DOWNLOAD_DEADLINE = 600
+
+
+#----------------------------------------------------------------------
+def get_remote_host(rdata):
+    """the host of the remote data, for the per host limit"""
+    if hasattr(rdata, 'get_remote_host'):
+        return rdata.get_remote_host()
+    return urlparse(str(getattr(rdata, 'remote_path', ''))).netloc
+
+
+#----------------------------------------------------------------------
+class DownloadEngine():
+    """asyncio download engine
+
+    the event loop runs in a daemon thread, the blocking sync_data of the
+    remote data runs in the executor, the concurrency is bounded by a global
+    and a per host semaphore. all the data managers submit to the same loop."""
+
+    def __init__(self, concurrency: int = DOWNLOAD_CONCURRENCY,
+                 host_concurrency: int = DOWNLOAD_HOST_CONCURRENCY):
+        """Constructor"""
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self._executor = ThreadPoolExecutor(max_workers = concurrency,
+                                            thread_name_prefix = 'download')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target = self._loop.run_forever,
+                                        name = 'DownloadEngine', daemon = True)
+        self._thread.start()
+        self._semaphore = None
+        self._host_semaphores = {}
+        self._tasks = set()
+
+    #----------------------------------------------------------------------
+    def get_host_semaphore(self, host: str):
+        """get the semaphore of the host, only called in the loop"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+        return self._host_semaphores[host]
+
+    #----------------------------------------------------------------------
+    async def sync_one(self, rdata):
+        """sync the remote data in the executor, the global slot is taken
+        after the host one, so the ones waiting for a busy host never block
+        the other hosts"""
+        host_semaphore = self.get_host_semaphore(get_remote_host(rdata))
+        async with host_semaphore:
+            async with self._semaphore:
+                future = self._loop.run_in_executor(self._executor, rdata.sync_data)
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # the thread can't be stopped, wait for it, so no file is
+                    # written after the wave is returned
+                    while not future.done():
+                        try:
+                            await asyncio.wait([future])
+                        except asyncio.CancelledError:
+                            pass
+                    raise
+
+    #----------------------------------------------------------------------
+    async def sync_all(self, rdatas: list, deadline: float):
+        """sync all the remote data, cancel the ones not done before deadline,
+        the running ones are waited until their threads are done"""
+        tasks = [self._loop.create_task(self.sync_one(rdata)) for rdata in rdatas]
+        self._tasks.update(tasks)
+        try:
+            if tasks:
+                done, pending = await asyncio.wait(tasks, timeout = deadline)
+                if pending:
+                    logger.error(f'{len(pending)} downloads cancelled after {deadline} seconds. ')
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions = True)
+        finally:
+            self._tasks.difference_update(tasks)
+        results = []
+        for rdata, task in zip(rdatas, tasks):
+            if task.cancelled():
+                results.append(None)
+            elif task.exception() is not None:
+                exc = task.exception()
+                logger.error(f'{rdata.remote_path} download failed: {"".join(traceback.format_exception_only(type(exc), exc))}')
+                results.append(None)
+            else:
+                results.append(task.result())
+        return results
+
+    #----------------------------------------------------------------------
+    def download(self, rdatas: list, deadline: float = DOWNLOAD_DEADLINE):
+        """download all the remote data in one wave, block until done"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.sync_all(rdatas, deadline), self._loop)
+        return future.result()
+
+    #----------------------------------------------------------------------
+    def cancel(self):
+        """cancel all the running downloads"""
+        def do_cancel():
+            for task in list(self._tasks):
+                task.cancel()
+        self._loop.call_soon_threadsafe(do_cancel)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+#----------------------------------------------------------------------
+def get_download_engine():
+    """get the process wide download engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = DownloadEngine()
+        return _engine
@@ -0,0 +1,199 @@
+# encoding: UTF-8
+
+from .utilities import \
+    DATE_FORMAT, INDEX_KEY, CLOSE_PRICE_NAME, SETTLE_PRICE_NAME, \
+    check_data_integrity, is_futures_file, load_futures_by_csv, \
+    index_to_date_str, hash_file, atomic_write
+from .logger import logger
+
+import os, glob, datetime, json
+import numpy as np
+import pandas as pd
+
+
+FUTURES_STORE_FILE = 'futures.npy'
+FROZEN_MANIFEST_FILE = 'frozen.json'
+# one row for each (expiration, trade date), sorted by them
+FUTURES_DTYPE = np.dtype([('expiration', 'datetime64[D]'),
+                          ('date', 'datetime64[D]'),
+                          ('close', 'float64'),
+                          ('settle', 'float64')])
+
+
+#----------------------------------------------------------------------
+class FuturesStore():
+    """columnar store of the settled futures
+
+    all the settled contracts are kept in one numpy structured array saved as
+    .npy, it's memory mapped when loaded, so reading a contract only touches
+    the rows of it."""
+
+    def __init__(self, path: str):
+        """Constructor"""
+        self.path = path
+        self.load()
+
+    #----------------------------------------------------------------------
+    def load(self):
+        """load the store by memory map"""
+        if os.path.exists(self.path):
+            self._data = np.load(self.path, mmap_mode = 'r')
+        else:
+            self._data = np.empty(0, dtype = FUTURES_DTYPE)
+        self._expirations = np.unique(self._data['expiration'])
+
+    #----------------------------------------------------------------------
+    def expirations(self):
+        """the expiration dates in the store"""
+        return np.datetime_as_string(self._expirations, unit = 'D').tolist()
+
+    #----------------------------------------------------------------------
+    def has(self, expiration: str):
+        """check if the contract is in the store"""
+        idx = np.searchsorted(self._expirations, np.datetime64(expiration, 'D'))
+        return idx < self._expirations.size and \
+            self._expirations[idx] == np.datetime64(expiration, 'D')
+
+    #----------------------------------------------------------------------
+    def get(self, expiration: str):
+        """get the rows of the contract"""
+        key = np.datetime64(expiration, 'D')
+        exps = self._data['expiration']
+        start = np.searchsorted(exps, key, side = 'left')
+        end = np.searchsorted(exps, key, side = 'right')
+        return self._data[start:end]
+
+    #----------------------------------------------------------------------
+    def get_frame(self, expiration: str):
+        """get the contract as the frame loaded from the csv file"""
+        rows = self.get(expiration)
+        index = pd.Index(np.datetime_as_string(rows['date'], unit = 'D'),
+                         name = INDEX_KEY)
+        return pd.DataFrame({CLOSE_PRICE_NAME: rows['close'],
+                             SETTLE_PRICE_NAME: rows['settle']},
+                            index = index)
+
+    #----------------------------------------------------------------------
+    def add(self, contracts: dict):
+        """add the settled contracts of {expiration: frame}, they are written
+        once, the contracts already in the store are ignored"""
+        chunks = [np.asarray(self._data)]
+        for expiration, info in contracts.items():
+            if self.has(expiration) or info.empty:
+                continue
+            rows = np.empty(info.shape[0], dtype = FUTURES_DTYPE)
+            rows['expiration'] = np.datetime64(expiration, 'D')
+            rows['date'] = index_to_date_str(info.index).astype('datetime64[D]')
+            rows['close'] = info[CLOSE_PRICE_NAME].to_numpy(dtype = float)
+            rows['settle'] = info[SETTLE_PRICE_NAME].to_numpy(dtype = float)
+            chunks.append(rows)
+        if len(chunks) == 1:
+            return False
+        data = np.concatenate(chunks)
+        data = data[np.lexsort((data['date'], data['expiration']))]
+        # write to the temp file then replace, the memory map is still valid
+        def write(tmp_path: str):
+            with open(tmp_path, 'wb') as file:
+                np.save(file, data)
+        atomic_write(self.path, write)
+        self.load()
+        return True
+
+    #----------------------------------------------------------------------
+    def compact(self, path: str, today: str = None):
+        """add the settled futures files under path to the store"""
+        if today is None:
+            today = datetime.date.today().strftime(DATE_FORMAT)
+        contracts = {}
+        for fpath in glob.glob(os.path.join(path, '*.csv')):
+            res, date = is_futures_file(fpath)
+            if not res or date >= today or self.has(date):
+                continue
+            if check_data_integrity(fpath, date):
+                # only the complete contract is settled
+                contracts[date] = load_futures_by_csv(fpath)
+        if self.add(contracts):
+            logger.info(f'{len(contracts)} settled futures added to {self.path}. ')
+
+    #----------------------------------------------------------------------
+    def iter_contracts(self, path: str):
+        """(delivery date, info) of the settled contracts and the live futures
+        files under path, from the later to the front"""
+        dates = set(self.expirations())
+        files = {}
+        for fpath in glob.glob(os.path.join(path, '*.csv')):
+            res, date = is_futures_file(fpath)
+            if res:
+                dates.add(date)
+                files[date] = fpath
+        for date in sorted(dates, reverse = True):
+            if self.has(date):
+                yield date, self.get_frame(date)
+            else:
+                yield date, load_futures_by_csv(files[date])
+
+
+#----------------------------------------------------------------------
+class FrozenManifest():
+    """the manifest of the frozen contracts
+
+    a contract is frozen once it's settled, compacted into the store and its
+    file is verified, the frozen contracts are never downloaded, checked or
+    hashed again. the manifest keeps {expiration: checksum of the file}."""
+
+    def __init__(self, path: str):
+        """Constructor"""
+        self.path = path
+        self._items = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as file:
+                    self._items = json.load(file)
+            except ValueError:
+                logger.error(f'{path} is broken, all the contracts are thawed. ')
+
+    #----------------------------------------------------------------------
+    def is_frozen(self, expiration: str):
+        """check if the contract is frozen"""
+        return expiration in self._items
+
+    #----------------------------------------------------------------------
+    def expirations(self):
+        """the expiration dates of the frozen contracts"""
+        return sorted(self._items)
+
+    #----------------------------------------------------------------------
+    def file_names(self):
+        """the futures file names of the frozen contracts"""
+        return {f'{expiration}.csv' for expiration in self._items}
+
+    #----------------------------------------------------------------------
+    def freeze(self, store: FuturesStore, path: str):
+        """freeze the contracts of the store, the futures file under path is
+        verified and hashed for the last time"""
+        frozen = []
+        for expiration in store.expirations():
+            if self.is_frozen(expiration):
+                continue
+            fpath = os.path.join(path, f'{expiration}.csv')
+            if not os.path.exists(fpath):
+                # only the store is left
+                self._items[expiration] = None
+            elif check_data_integrity(fpath, expiration):
+                self._items[expiration] = hash_file(fpath)
+            else:
+                logger.error(f'{fpath} is not the settled one in the store, not frozen. ')
+                continue
+            frozen.append(expiration)
+        if frozen:
+            self.save()
+            logger.info(f'{len(frozen)} contracts frozen in {self.path}. ')
+        return frozen
+
+    #----------------------------------------------------------------------
+    def save(self):
+        """save the manifest, it's replaced at once"""
+        def write(tmp_path: str):
+            with open(tmp_path, 'w') as file:
+                json.dump(self._items, file, indent = 0, sort_keys = True)
+        atomic_write(self.path, write)
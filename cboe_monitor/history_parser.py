@@ -0,0 +1,142 @@
+# encoding: UTF-8
+
+from .utilities import \
+    OPEN_PRICE_NAME, HIGH_PRICE_NAME, LOW_PRICE_NAME, CLOSE_PRICE_NAME, VOLUME_NAME
+from .logger import logger
+
+import re, json
+import numpy as np
+import pandas as pd
+
+
+# the price keys of the json rows and the columns of the frame
+HISTORY_PRICE_KEYS = (('open',  OPEN_PRICE_NAME),
+                      ('high',  HIGH_PRICE_NAME),
+                      ('low',   LOW_PRICE_NAME),
+                      ('close', CLOSE_PRICE_NAME))
+HISTORY_DATE_KEY = 'date'
+HISTORY_VOLUME_KEY = 'volume'
+
+DATA_ARRAY_PATTERN = re.compile(r'"data"\s*:\s*\[')
+SEPARATOR_PATTERN = re.compile(r'[\s,]*')
+DATE_VALUE_PATTERN = re.compile(r'"%s"\s*:\s*"([^"]*)"' % HISTORY_DATE_KEY)
+NUMBER_VALUE_PATTERNS = {key: re.compile(r'"%s"\s*:\s*([^,}\s]*)' % key)
+                         for key, _name in HISTORY_PRICE_KEYS + ((HISTORY_VOLUME_KEY, VOLUME_NAME),)}
+
+_decoder = json.JSONDecoder()
+# the json types of the values, null is nan
+NUMBER_TYPES = (int, float, type(None))
+
+
+#----------------------------------------------------------------------
+def make_history_frame(dates, prices: dict, volumes: np.ndarray):
+    """make the frame on the column arrays without copying them"""
+    columns = {name: prices[key] for key, name in HISTORY_PRICE_KEYS}
+    columns[VOLUME_NAME] = volumes
+    index = pd.Index(dates, name = HISTORY_DATE_KEY)
+    return pd.DataFrame(columns, index = index, copy = False)
+
+
+#----------------------------------------------------------------------
+def scan_history_columns(payload: str, start: int, end: int, size: int):
+    """scan the values of each key into the typed column, returns None if the
+    rows are not the flat ones with all the keys and numbers"""
+    dates = DATE_VALUE_PATTERN.findall(payload, start, end)
+    if len(dates) != size:
+        return None
+    # one column of the strings is kept at the same time
+    columns = {}
+    for key, pattern in NUMBER_VALUE_PATTERNS.items():
+        values = pattern.findall(payload, start, end)
+        if len(values) != size:
+            return None
+        try:
+            if HISTORY_VOLUME_KEY == key:
+                try:
+                    columns[key] = np.fromiter(map(int, values), dtype = np.int64, count = size)
+                    continue
+                except ValueError:
+                    # the volume is float if any of it is
+                    pass
+            columns[key] = np.fromiter(map(float, values), dtype = np.float64, count = size)
+        except ValueError:
+            # null or the other values
+            return None
+    volumes = columns.pop(HISTORY_VOLUME_KEY)
+    return make_history_frame(dates, columns, volumes)
+
+
+#----------------------------------------------------------------------
+def check_history_row(row, n: int):
+    """raise ValueError if the row can't be parsed, the missing values are
+    logged, they are nan"""
+    if not isinstance(row, dict) or not isinstance(row.get(HISTORY_DATE_KEY), str):
+        raise ValueError(f'the row {n} of the history json has no date: {row!r:.100}')
+    missing = []
+    for key, _name in HISTORY_PRICE_KEYS + ((HISTORY_VOLUME_KEY, VOLUME_NAME),):
+        if key not in row:
+            missing.append(key)
+        elif type(row[key]) not in NUMBER_TYPES:
+            raise ValueError(f'the {key} of the row {n} of the history json '
+                             f'is not a number: {row!r:.100}')
+    if missing:
+        logger.warning(f'the row {row[HISTORY_DATE_KEY]} of the history json has no '
+                       f'{", ".join(missing)}, they are nan. ')
+
+
+#----------------------------------------------------------------------
+def decode_history_rows(payload: str, pos: int, size: int):
+    """decode the rows one by one into the preallocated columns, the malformed
+    rows raise ValueError"""
+    dates = np.empty(size, dtype = object)
+    prices = {key: np.empty(size, dtype = np.float64) for key, _name in HISTORY_PRICE_KEYS}
+    volumes = np.empty(size, dtype = np.float64)
+    volume_is_int = True
+    n = 0
+    while True:
+        pos = SEPARATOR_PATTERN.match(payload, pos).end()
+        if pos >= len(payload):
+            raise ValueError('the data array of the history json is not closed. ')
+        if ']' == payload[pos]:
+            break
+        row, pos = _decoder.raw_decode(payload, pos)
+        if n >= size:
+            raise ValueError(f'the row {n} of the history json has no date. ')
+        check_history_row(row, n)
+        dates[n] = row[HISTORY_DATE_KEY]
+        for key, column in prices.items():
+            # null is nan
+            column[n] = row.get(key)
+        volume = row.get(HISTORY_VOLUME_KEY)
+        volume_is_int = volume_is_int and type(volume) is int
+        volumes[n] = volume
+        n += 1
+    # the volume is int unless any of it is not
+    volumes = volumes[:n].astype(np.int64) if volume_is_int and n > 0 else volumes[:n]
+    prices = {key: column[:n] for key, column in prices.items()}
+    return make_history_frame(dates[:n], prices, volumes)
+
+
+#----------------------------------------------------------------------
+def parse_history_json(payload):
+    """parse the cboe history json into the frame indexed by date
+
+    the values are read from the data array straight into the typed columns,
+    the whole json is never loaded as the list of the rows. the flat rows are
+    scanned column by column, the others are decoded row by row."""
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    res = DATA_ARRAY_PATTERN.search(payload)
+    if res is None:
+        raise ValueError('no data array found in the history json. ')
+    start = res.end()
+    end = payload.find(']', start)
+    if end >= 0 and payload.find('[', start, end) < 0:
+        # every row has one date, it's the size of the columns
+        size = payload.count(f'"{HISTORY_DATE_KEY}"', start, end)
+        df = scan_history_columns(payload, start, end, size)
+        if df is not None:
+            return df
+    # the upper bound of the rows
+    size = payload.count(f'"{HISTORY_DATE_KEY}"', start)
+    return decode_history_rows(payload, start, size)
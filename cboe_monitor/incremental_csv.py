@@ -0,0 +1,133 @@
+# encoding: UTF-8
+
+from .utilities import load_vix_by_csv, read_last_rows, \
+    atomic_to_csv, atomic_write, journal_write
+from .logger import logger
+
+import os, json
+import pandas as pd
+
+
+# rows of the file's tail kept in the offset index
+TAIL_INDEX_ROWS = 64
+INDEX_SUFFIX = '.idx'
+
+
+#----------------------------------------------------------------------
+def get_row_key(line: str):
+    """the index of the csv line"""
+    return line.split(',', 1)[0]
+
+
+#----------------------------------------------------------------------
+class IncrementalCsvWriter():
+    """write the csv file indexed by date incrementally
+
+    the offsets of the last rows are kept in a sidecar index file, the file is
+    truncated back to the first changed row and only the new or revised rows
+    are appended. the index is rebuilt from the tail if the file is changed
+    by others."""
+
+    def __init__(self, path: str, tail_rows: int = TAIL_INDEX_ROWS):
+        """Constructor"""
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.tail_rows = tail_rows
+
+    #----------------------------------------------------------------------
+    def load_index(self):
+        """load the (key, offset) of the last rows"""
+        stat = os.stat(self.path)
+        try:
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+            if index['size'] == stat.st_size and index['mtime_ns'] == stat.st_mtime_ns:
+                return index['rows']
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        # the index is missing or out of date
+        return [[get_row_key(line), offset] for offset, line in
+                read_last_rows(self.path, self.tail_rows)]
+
+    #----------------------------------------------------------------------
+    def save_index(self, rows: list):
+        """save the index of the last rows"""
+        stat = os.stat(self.path)
+        def write(tmp_path: str):
+            with open(tmp_path, 'w') as file:
+                json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                           'rows': rows[-self.tail_rows:]}, file)
+        atomic_write(self.index_path, write)
+
+    #----------------------------------------------------------------------
+    def write_all(self, data: pd.DataFrame):
+        """write all the data, the file is replaced at once"""
+        atomic_to_csv(data, self.path)
+        self.save_index(self.load_index())
+        return data
+
+    #----------------------------------------------------------------------
+    def merge_all(self, data: pd.DataFrame):
+        """merge the data with the whole local file, the rows of data take
+        the place of the local ones with the same index"""
+        ldf = load_vix_by_csv(self.path)
+        data = pd.concat([ldf, data])
+        # drop the duplicated index rows
+        data = data[~data.index.duplicated(keep = 'last')]
+        return self.write_all(data)
+
+    #----------------------------------------------------------------------
+    def read_header(self):
+        """read the header line of the file"""
+        with open(self.path, 'rb') as file:
+            line = file.readline()
+        return line.decode('utf-8').rstrip('\r\n'), len(line)
+
+    #----------------------------------------------------------------------
+    def update(self, data: pd.DataFrame):
+        """update the file by the data, returns True if the file changed"""
+        if not os.path.exists(self.path):
+            self.write_all(data)
+            return True
+        lines = data.to_csv().splitlines()
+        new_rows = {get_row_key(line): line for line in lines[1:] if line}
+        if not new_rows:
+            # no rows, nothing changed
+            return False
+        header, header_size = self.read_header()
+        if header != lines[0]:
+            # the columns are changed, rewrite the whole file
+            logger.info(f'columns of {self.path} changed, rewrite it. ')
+            self.merge_all(data)
+            return True
+        index = self.load_index()
+        first_key = min(new_rows)
+        if index == [] or (first_key < index[0][0] and index[0][1] != header_size):
+            # the changed rows are out of the index
+            self.merge_all(data)
+            return True
+        # the local rows in the index
+        with open(self.path, 'rb') as file:
+            file.seek(index[0][1])
+            tail = file.read().decode('utf-8').split('\n')
+        local_rows = {get_row_key(line): line.rstrip('\r') for line in tail if line.strip()}
+        changed = [key for key in sorted(new_rows) if local_rows.get(key) != new_rows[key]]
+        if changed == []:
+            return False
+        first_changed = changed[0]
+        kept = [row for row in index if row[0] < first_changed]
+        cut = index[len(kept)][1] if len(kept) < len(index) else os.path.getsize(self.path)
+        # the local rows after the first changed one are rewritten with the new rows
+        rows = {key: line for key, line in local_rows.items() if key >= first_changed}
+        rows.update({key: line for key, line in new_rows.items() if key >= first_changed})
+        offset = cut
+        lines = []
+        for key in sorted(rows):
+            line = (rows[key] + os.linesep).encode('utf-8')
+            lines.append(line)
+            kept.append([key, offset])
+            offset += len(line)
+        # the tail is journaled, it's redone by the recovery if interrupted
+        journal_write(self.path, cut, b''.join(lines))
+        self.save_index(kept)
+        return True
@@ -0,0 +1,236 @@
+# encoding: UTF-8
+
+from .utilities import atomic_write, get_file_path
+from .schedule_manager import ScheduleManager, get_crontab, CRONTAB_MIN_DELAY, RETRY_DELAY
+from .util_http_bs4 import HttpValidatorCache, probe_modified
+from .logger import logger
+
+import os, json, random, threading, time
+
+
+PUBLICATION_HISTORY_FILE = 'publication.jsonl'
+# the recent days kept for each symbol
+PUBLICATION_HISTORY_SIZE = 20
+# the offsets longer than this are not the normal publications
+PUBLICATION_MAX_OFFSET = 6 * 3600
+# the probes start this long before the expected publication
+PROBE_LEAD = 120
+# the probe delays near the expected publication, the later it's overdue
+# the longer the delay is, doubled every backoff window up to the max
+PROBE_MIN_DELAY = 30
+PROBE_MAX_DELAY = 300
+PROBE_BACKOFF_WINDOW = 900
+# the random part of the probe delay
+PROBE_JITTER = 0.5
+
+
+#----------------------------------------------------------------------
+class PublicationHistory():
+    """the seconds after the scheduled fire when the data of each symbol was
+    published over the past runs
+
+    one json line for each symbol and day, the recent days are kept only. the
+    whole history is written atomically when a new day is recorded."""
+
+    def __init__(self, path: str):
+        """Constructor"""
+        self.path = path
+        self._lock = threading.Lock()
+        # {symbol: {day: offset}}
+        self._items = {}
+        if os.path.exists(path):
+            self.load()
+
+    #----------------------------------------------------------------------
+    def load(self):
+        """load the history, the broken lines are skipped"""
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    item = json.loads(line)
+                    self._items.setdefault(item['symbol'], {})[item['day']] = float(item['offset'])
+                except (ValueError, KeyError, TypeError):
+                    logger.error(f'broken line of {self.path} skipped. ')
+
+    #----------------------------------------------------------------------
+    def record(self, symbol: str, day: str, offset: float):
+        """record the offset of the day, the abnormal ones are ignored,
+        returns True if it's recorded"""
+        if offset < 0 or offset > PUBLICATION_MAX_OFFSET:
+            return False
+        with self._lock:
+            days = self._items.setdefault(symbol, {})
+            if day in days:
+                # the first publication of the day is kept
+                return False
+            days[day] = offset
+            for old in sorted(days)[:-PUBLICATION_HISTORY_SIZE]:
+                del days[old]
+            if day not in days:
+                # older than all the kept days
+                return False
+            self.save()
+        return True
+
+    #----------------------------------------------------------------------
+    def get_offsets(self, symbol: str):
+        """the recorded offsets of the symbol, ordered by the day"""
+        with self._lock:
+            days = self._items.get(symbol, {})
+            return [days[day] for day in sorted(days)]
+
+    #----------------------------------------------------------------------
+    def expected_offset(self, symbols: list):
+        """the expected offset when all the symbols are published, the median
+        of each symbol's history, None if any of them has no history"""
+        expected = None
+        for symbol in symbols:
+            offsets = sorted(self.get_offsets(symbol))
+            if not offsets:
+                return None
+            median = offsets[len(offsets) // 2]
+            expected = median if expected is None else max(expected, median)
+        return expected
+
+    #----------------------------------------------------------------------
+    def save(self):
+        """write the history atomically, called with the lock held"""
+        def write(tmp_path: str):
+            with open(tmp_path, 'w') as file:
+                for symbol in sorted(self._items):
+                    days = self._items[symbol]
+                    for day in sorted(days):
+                        item = {'symbol': symbol, 'day': day, 'offset': days[day]}
+                        file.write(json.dumps(item, separators = (',', ':')) + '\n')
+        atomic_write(self.path, write)
+
+
+#----------------------------------------------------------------------
+def get_first_probe_offset(expected: float = None):
+    """the offset of the first attempt after the scheduled fire, it's a
+    little before the expected publication"""
+    if expected is None:
+        return 0
+    return max(0, expected - PROBE_LEAD)
+
+
+#----------------------------------------------------------------------
+def next_probe_delay(elapsed: float, expected: float = None):
+    """the seconds to the next probe, elapsed is the seconds since the
+    scheduled fire
+
+    it waits until a little before the expected publication, probes tightly
+    around it, then backs off the longer it's overdue. the delay is jittered
+    downward, so it never exceeds the tight interval near the publication."""
+    if expected is None:
+        expected = 0
+    ahead = expected - elapsed
+    if ahead > PROBE_LEAD:
+        delay = ahead - PROBE_LEAD
+    else:
+        overdue = max(0, -ahead)
+        delay = min(PROBE_MIN_DELAY * 2 ** int(overdue // PROBE_BACKOFF_WINDOW),
+                    PROBE_MAX_DELAY)
+    return delay - random.uniform(0, PROBE_JITTER * min(delay, PROBE_MIN_DELAY))
+
+
+#----------------------------------------------------------------------
+class PublicationScheduleManager(ScheduleManager):
+    """the daily job of the data published some time after the crontab
+
+    the first attempt of the fire is shifted to a little before the
+    publication expected by the history, the failed ones are retried by the
+    probes around it. do_attempt does the job of the stages, the fire is done
+    once it returns True."""
+
+    # the names of the stages recorded in the history
+    _stage_names = ()
+    _history = None
+    _probe_cache = None
+    _last_attempt = None
+    _done_fire = None
+    # the epoch seconds of the last probe
+    _probe_time = None
+    # the stages found not published yet
+    _unpublished = None
+
+    def __init__(self, doit: bool = False):
+        """Constructor"""
+        self._history = PublicationHistory(get_file_path(PUBLICATION_HISTORY_FILE))
+        self.reset_probes()
+        super(PublicationScheduleManager, self).__init__(doit)
+
+    def get_scheduled_fire(self):
+        """the epoch seconds of the last fire of the crontab"""
+        return round(time.time() + get_crontab(self._crontab).previous(default_utc = True))
+
+    def get_pending_stages(self):
+        """the names of the stages not done yet"""
+        raise NotImplementedError
+
+    def get_delay_time(self):
+        """the first attempt of the day is a little before the publication
+        expected by the history"""
+        offset = get_first_probe_offset(self._history.expected_offset(list(self._stage_names)))
+        fire = self.get_scheduled_fire()
+        delay = fire + offset - time.time()
+        if delay > CRONTAB_MIN_DELAY and fire != self._done_fire:
+            # the shifted attempt of the last fire is not due yet
+            return delay
+        return super(PublicationScheduleManager, self).get_delay_time() + offset
+
+    def get_retry_delay(self):
+        """probe tightly around the expected publication of the pending
+        stages, backed off if it's overdue"""
+        expected = self._history.expected_offset(self.get_pending_stages())
+        return next_probe_delay(time.time() - self.get_scheduled_fire(), expected)
+
+    def reset_probes(self):
+        """the validators of the other day are useless"""
+        self._probe_cache = HttpValidatorCache()
+        self._last_attempt = None
+        self._probe_time = None
+        self._unpublished = set()
+
+    def probe_urls(self, urls: list):
+        """probe the urls of the pending stages by the cheap HEAD requests,
+        True if any of them is modified since the last probe. the full
+        attempt is forced if the last one is too old, as the failure may be
+        caused by the network"""
+        self._probe_time = time.time()
+        # all the urls are probed to keep the validators up to date
+        modified = [probe_modified(url, self._probe_cache) for url in urls]
+        if self._last_attempt is None or \
+           time.monotonic() - self._last_attempt >= RETRY_DELAY:
+            return True
+        return any(modified)
+
+    def start_attempt(self):
+        """the full attempt starts"""
+        self._last_attempt = time.monotonic()
+
+    def mark_unpublished(self, names: list):
+        """the stages are found not published yet"""
+        self._unpublished.update(names)
+
+    def record_publication(self, names: list, day: str):
+        """record when the stages done in this attempt are published, it's
+        the probe which found them modified. the ones done at their first
+        attempt may be published long before it, they are not recorded"""
+        probe_time = time.time() if self._probe_time is None else self._probe_time
+        offset = probe_time - self.get_scheduled_fire()
+        for name in names:
+            if name in self._unpublished and self._history.record(name, day, offset):
+                logger.info(f'{name} published {offset:.0f} seconds after the schedule. ')
+
+    def do_timeout(self):
+        """the fire is done once the attempt succeeds, so is its shifted
+        first attempt"""
+        if not self.do_attempt():
+            return False
+        self._done_fire = self.get_scheduled_fire()
+        return True
+
+    def do_attempt(self):
+        """do the stages, True if all of them are done"""
+        raise NotImplementedError
@@ -1,16 +1,22 @@
 #encoding: UTF-8
 
 from .utilities import \
-    CHECK_SECTION, INDEX_KEY, DATE_FORMAT, \
-    check_file_integrity, load_vix_by_csv, get_recent_trading_days, \
+    INDEX_KEY, DATE_FORMAT, \
+    check_file_integrity, check_data_integrity, load_vix_by_csv, atomic_to_csv, \
+    TradingDayContext, read_last_index, \
     OPEN_PRICE_NAME, HIGH_PRICE_NAME, LOW_PRICE_NAME, CLOSE_PRICE_NAME, VOLUME_NAME
-from .util_http_bs4 import get_content_json
+from .util_http_bs4 import get_content, get_content_json, http_get, conditional_get, \
+    HttpValidatorCache
+from .history_parser import parse_history_json
+from .incremental_csv import IncrementalCsvWriter
+from .checksum_manifest import ChecksumManifest
 from .logger import logger
 
 from abc import abstractclassmethod, ABCMeta
 from enum import Enum
-import os, re, configparser, traceback, urllib, urllib3, requests, http, time
+import os, re, io, traceback, urllib, urllib3, requests, http, time
 from datetime import datetime, timedelta
+from urllib.parse import urlparse
 import dateutil.parser as date_parser
 import pandas as pd
 import pandas_datareader as pdr
@@ -37,13 +43,17 @@ FIX_FILE_PATTERN = re.compile(r'\^|\=')
 #----------------------------------------------------------------------
 class IRemoteData(metaclass = ABCMeta):
 
-    def __init__(self, ini_parser: configparser.ConfigParser,
-                 data_path: str, local: str, remote_path: str):
+    def __init__(self, checksums: ChecksumManifest,
+                 data_path: str, local: str, remote_path: str,
+                 http_cache: HttpValidatorCache = None,
+                 trading_days: TradingDayContext = None):
         """Constructor"""
-        self.ini_parser = ini_parser
+        self.checksums = checksums
         self.data_path = data_path
         self.local = self.fix_file_name(local)
         self.remote_path = remote_path
+        self.http_cache = http_cache
+        self.trading_days = trading_days
 
     #----------------------------------------------------------------------
     def fix_file_name(self, local: str):
@@ -51,6 +61,11 @@ class IRemoteData(metaclass = ABCMeta):
         res = FIX_FILE_PATTERN.subn('', local)
         return res[0]
 
+    #----------------------------------------------------------------------
+    def get_remote_host(self):
+        """get the host of the remote path"""
+        return urlparse(self.remote_path).netloc
+
     #----------------------------------------------------------------------
     def get_local_file(self):
         """get local file name"""
@@ -64,12 +79,9 @@ class IRemoteData(metaclass = ABCMeta):
     #----------------------------------------------------------------------
     def get_local_checksum(self):
         """get local file's checksum"""
-        try:
-            if self.ini_parser:
-                return self.ini_parser.get(CHECK_SECTION, self.get_local_file())
-            return None
-        except configparser.NoOptionError:
-            return None
+        if self.checksums:
+            return self.checksums.get(self.get_local_file())
+        return None
 
     #----------------------------------------------------------------------
     def get_last_index(self):
@@ -80,12 +92,34 @@ class IRemoteData(metaclass = ABCMeta):
         except (FileNotFoundError, IndexError):
             return None, None
 
+    #----------------------------------------------------------------------
+    def get_local_last_index(self):
+        """get the local last index by reading the file's tail only"""
+        return read_last_index(self.get_local_path())
+
+    #----------------------------------------------------------------------
+    def load_local_data(self):
+        """load the local data, None if no data"""
+        try:
+            df = load_vix_by_csv(self.get_local_path())
+        except FileNotFoundError:
+            return None
+        if df.empty:
+            return None
+        return df
+
+    #----------------------------------------------------------------------
+    def is_local_intact(self):
+        """check the local file by the checksum, the unchanged file with the
+        size and mtime of the manifest is not hashed"""
+        if self.checksums:
+            return self.checksums.is_intact(self.get_local_path())
+        return check_file_integrity(self.get_local_path(), None)
+
     #----------------------------------------------------------------------
     def sync_data(self):
         """sync the data if needed. """
-        checksum = self.get_local_checksum()
-        local_path = self.get_local_path()
-        if not check_file_integrity(local_path, checksum):
+        if not self.is_local_intact():
             return self.safe_sync_data()
 
     #----------------------------------------------------------------------
@@ -100,6 +134,8 @@ class IRemoteData(metaclass = ABCMeta):
                 urllib.error.HTTPError,
                 urllib3.exceptions.MaxRetryError,
                 requests.exceptions.ConnectionError,
+                requests.exceptions.HTTPError,
+                requests.exceptions.Timeout,
                 pdr._utils.RemoteDataError):
             # for network error handling
             # logger.error(f'{self.remote_path} download failed: {traceback.format_exc()}')
@@ -126,18 +162,50 @@ class IRemoteData(metaclass = ABCMeta):
             return
         # df = df.iloc[:-n]
         df.drop(df.tail(n).index, inplace = True)
-        df.to_csv(path_or_buf = self.get_local_path())
+        atomic_to_csv(df, self.get_local_path())
 
 
 #----------------------------------------------------------------------
 class RemoteHttpFileData(IRemoteData):
 
+    #----------------------------------------------------------------------
+    def is_local_broken(self):
+        """check if the local file mismatches its checksum, it's not broken if
+        it's missing or its checksum is unknown"""
+        return self.get_local_checksum() is not None and \
+            os.path.exists(self.get_local_path())
+
+    #----------------------------------------------------------------------
+    def sync_data(self):
+        """sync the data if needed, the intact file is never requested, nor is
+        the immutable one unless it's broken"""
+        if self.is_local_intact():
+            return
+        self._broken = self.is_local_broken()
+        if not self._broken and self.http_cache is not None and \
+           self.http_cache.is_immutable(self.remote_path) and \
+           os.path.exists(self.get_local_path()):
+            return
+        return self.safe_sync_data()
+
     #----------------------------------------------------------------------
     def do_sync_data(self):
         """sync the data"""
-        data = pd.read_csv(self.remote_path)
-        # without index
-        data.to_csv(index = False, path_or_buf = self.get_local_path())
+        local_path = self.get_local_path()
+        # the conditional request is only for the existed local file, the
+        # validators of the broken one are useless
+        conditional = os.path.exists(local_path) and not getattr(self, '_broken', False)
+        response = conditional_get(self.remote_path, self.http_cache, conditional)
+        if 304 == response.status_code:
+            logger.info(f'{self.remote_path} is not modified. ')
+            data = None
+        else:
+            data = pd.read_csv(io.BytesIO(response.content))
+            # without index
+            atomic_to_csv(data, local_path, index = False)
+        if self.http_cache is not None and check_data_integrity(local_path, self.local):
+            # the contract is expired, it's never changed
+            self.http_cache.set_immutable(self.remote_path)
         return data
 
 
@@ -158,21 +226,21 @@ class IRemoteHttpData(IRemoteData):
     #----------------------------------------------------------------------
     def do_sync_data(self):
         """sync the data"""
-        li, ldf = self.get_last_index()
+        li = self.get_local_last_index()
         data = self.query_remote(li)
         data.index.rename(INDEX_KEY, inplace = True)
         # with index
-        if ldf is None:
-            data.to_csv(path_or_buf = self.get_local_path())
+        if li is None:
+            atomic_to_csv(data, self.get_local_path())
         else:
             # append data to the local path, this is not work due to the last
             # row is changed from time to time
             # data.to_csv(path_or_buf = self.get_local_path(), mode = 'a', header = False)
             self.fix_data_index(data)
-            data = pd.concat([ldf, data])
+            data = pd.concat([self.load_local_data(), data])
             # drop the duplicated index rows
             data = data[~data.index.duplicated(keep = 'last')]
-            data.to_csv(path_or_buf = self.get_local_path())
+            atomic_to_csv(data, self.get_local_path())
         return data
 
 
@@ -197,7 +265,9 @@ class RemoteHttpYahooData(IRemoteHttpData):
         """download the data"""
         url = self.mk_url(start)
         logger.info(f'download url: {url}')
-        data = pd.read_csv(url, index_col = 0)
+        response = http_get(url)
+        response.raise_for_status()
+        data = pd.read_csv(io.BytesIO(response.content), index_col = 0)
         return data
 
     #----------------------------------------------------------------------
@@ -227,20 +297,32 @@ class RemoteHttpCBOEData(IRemoteHttpData):
 
     history_url = "https://cdn.cboe.com/api/global/delayed_quotes/charts/historical/_%s.json"
     quotes_url = "https://cdn.cboe.com/api/global/delayed_quotes/quotes/_%s.json"
-    query_dates = []
+
+    #----------------------------------------------------------------------
+    def get_remote_host(self):
+        """the remote path is the symbol, use the host of the url"""
+        return urlparse(self.history_url).netloc
+
+    #----------------------------------------------------------------------
+    def get_query_dates(self):
+        """the recent trading days of this run"""
+        if self.trading_days is None:
+            # not shared, compute it for this instance only
+            self.trading_days = TradingDayContext()
+        return self.trading_days.recent_days
 
     #----------------------------------------------------------------------
     def get_url(self, start: str):
         """"""
-        self.query_dates = get_recent_trading_days()
+        query_dates = self.get_query_dates()
         if start is None:
             return True, CBOE_REMOTE_DATA_TYPE.HISTORY, self.history_url % self.local
         else:
-            if start in self.query_dates:
-                if start == self.query_dates[-2]:
+            if start in query_dates:
+                if start == query_dates[-2]:
                     # we only need to download the last day's data
                     return True, CBOE_REMOTE_DATA_TYPE.QUOTES, self.quotes_url % self.local
-                elif start == self.query_dates[-1]:
+                elif start == query_dates[-1]:
                     # no data download needed
                     return False
             # some data have been lost, we need to download all data again
@@ -250,11 +332,13 @@ class RemoteHttpCBOEData(IRemoteHttpData):
     def do_data_handle(self, params: tuple):
         """"""
         _check, query_type, url = params
-        data = get_content_json(url)
         if CBOE_REMOTE_DATA_TYPE.HISTORY == query_type:
-            data = self.do_history_data_handle(data)
+            # the history is parsed from the raw payload, it's never loaded as a whole
+            data = get_content(url, lambda response: self.do_history_data_handle(response.content))
+            if data is False:
+                raise ValueError(f'history data from {url} not parsed. ')
         elif CBOE_REMOTE_DATA_TYPE.QUOTES == query_type:
-            data = self.do_quotes_data_handle(data)
+            data = self.do_quotes_data_handle(get_content_json(url))
         else:
             raise NotImplementedError(f'not supported cboe remote type: {query_type}')
         data.index.rename(INDEX_KEY, inplace = True)
@@ -262,17 +346,9 @@ class RemoteHttpCBOEData(IRemoteHttpData):
         return data
 
     #----------------------------------------------------------------------
-    def do_history_data_handle(self, data_dic: dict):
+    def do_history_data_handle(self, payload: bytes):
         """convert history json data to pandas dataframe"""
-        data = data_dic['data']
-        df = pd.DataFrame(data)
-        df.set_index('date', inplace = True)
-        df.rename({'open'  : OPEN_PRICE_NAME,
-                   'high'  : HIGH_PRICE_NAME,
-                   'low'   : LOW_PRICE_NAME,
-                   'close' : CLOSE_PRICE_NAME,
-                   'volume': VOLUME_NAME}, axis = 1, inplace = True)
-        return df
+        return parse_history_json(payload)
 
     #----------------------------------------------------------------------
     def do_quotes_data_handle(self, data_dic: dict):
@@ -287,8 +363,9 @@ class RemoteHttpCBOEData(IRemoteHttpData):
                    'close' : CLOSE_PRICE_NAME,
                    'volume' : VOLUME_NAME}, axis = 1, inplace = True)
         df = df[[OPEN_PRICE_NAME, HIGH_PRICE_NAME, LOW_PRICE_NAME, CLOSE_PRICE_NAME, VOLUME_NAME]]
-        if df.index[-1] != self.query_dates[-1]:
-            raise ValueError(f'date expected error: for {self.query_dates[-1]} but get {df.index[-1]}. ')
+        query_dates = self.get_query_dates()
+        if df.index[-1] != query_dates[-1]:
+            raise ValueError(f'date expected error: for {query_dates[-1]} but get {df.index[-1]}. ')
         return df
 
 
@@ -308,22 +385,20 @@ class RemoteHttpCBOEData(IRemoteHttpData):
             self._query_times = 0
         else:
             self._query_times += 1
-        li, ldf = self.get_last_index()
+        li = self.get_local_last_index()
         data = self.query_remote(li)
         if data is False or self._query_times >= 2:
-            return ldf
+            # the local data is loaded only when it's needed
+            return self.load_local_data()
         data.index.rename(INDEX_KEY, inplace = True)
         # with index
-        if ldf is None:
-            data.to_csv(path_or_buf = self.get_local_path())
+        writer = IncrementalCsvWriter(self.get_local_path())
+        if li is None:
+            writer.write_all(data)
         else:
-            # append data to the local path, this is not work due to the last
-            # row is changed from time to time
-            # data.to_csv(path_or_buf = self.get_local_path(), mode = 'a', header = False)
-            data = pd.concat([ldf, data])
-            # drop the duplicated index rows
-            data = data[~data.index.duplicated(keep = 'last')]
-            data.to_csv(path_or_buf = self.get_local_path())
+            # the last row is changed from time to time, the writer truncates
+            # the file back to the first changed row and appends from there
+            writer.update(data)
         # recursive call sync data
         time.sleep(1)
         return self.do_sync_data(1)
@@ -333,26 +408,36 @@ class RemoteHttpCBOEData(IRemoteHttpData):
 class RemoteDataFactory():
 
     data_path = ''
-    ini_parser = None
+    checksums = None
+    http_cache = None
+    trading_days = None
 
-    def __init__(self, data_path: str, ini_parser: configparser.ConfigParser):
+    def __init__(self, data_path: str, checksums: ChecksumManifest,
+                 http_cache: HttpValidatorCache = None,
+                 trading_days: TradingDayContext = None):
         """Constructor"""
         self.data_path = data_path
-        self.ini_parser = ini_parser
+        self.checksums = checksums
+        self.http_cache = http_cache
+        self.trading_days = trading_days
 
     #----------------------------------------------------------------------
     def create(self, local: str, remote: str, via: SYNC_DATA_MODE):
         """the creator of RemoteData"""
         if SYNC_DATA_MODE.HTTP_DOWNLOAD_FILE == via:
             return RemoteHttpFileData(
-                self.ini_parser, self.data_path, local, remote)
+                self.checksums, self.data_path, local, remote,
+                self.http_cache, self.trading_days)
         elif SYNC_DATA_MODE.HTTP_DOWNLOAD_CBOE == via:
             return RemoteHttpCBOEData(
-                self.ini_parser, self.data_path, local, remote)
+                self.checksums, self.data_path, local, remote,
+                self.http_cache, self.trading_days)
         elif SYNC_DATA_MODE.PANDAS_DATAREADER_YAHOO == via:
             return RemotePDRYahooData(
-                self.ini_parser, self.data_path, local, remote)
+                self.checksums, self.data_path, local, remote,
+                self.http_cache, self.trading_days)
         elif SYNC_DATA_MODE.HTTP_DOWNLOAD_YAHOO == via:
             return RemoteHttpYahooData(
-                self.ini_parser, self.data_path, local, remote)
+                self.checksums, self.data_path, local, remote,
+                self.http_cache, self.trading_days)
         raise NotImplementedError
@@ -0,0 +1,168 @@
+# encoding: UTF-8
+
+from .utilities import \
+    CLOSE_PRICE_NAME, VOLUME_NAME, HV_DISTRIBUTION_PERIODS, \
+    file_fingerprint, load_vix_by_csv, close_ma5_ma10_ma20, \
+    historical_max_min_per, rolling_percent_distribution, RollingPercentile
+
+import os, io, hashlib, threading
+import pandas as pd
+
+
+# the longest rolling window of close_ma5_ma10_ma20
+MA_WINDOW = 20
+
+
+#----------------------------------------------------------------------
+def prepare_index_frame(df: pd.DataFrame):
+    """drop the rows without close and the volume column"""
+    df = df.dropna(subset = [CLOSE_PRICE_NAME])
+    return df.drop(columns = [VOLUME_NAME], errors = 'ignore')
+
+
+#----------------------------------------------------------------------
+def fix_mper_dtype(df: pd.DataFrame):
+    """the mper is int if none of it is nan, the same as the full calculation"""
+    if not df['mper'].isna().any():
+        df['mper'] = df['mper'].astype(int)
+
+
+#----------------------------------------------------------------------
+class ResidentFrame():
+    """the analyzed frame of one index csv kept in memory between the runs
+
+    the moving averages, the historical max, min and the percentage are kept
+    with the rows, when the file grows only the rows from the last loaded one
+    are parsed, and the columns are calculated for them only. all the rows
+    are loaded again if the rows before the last one are changed."""
+
+    def __init__(self, path: str, size: int = HV_DISTRIBUTION_PERIODS):
+        """Constructor"""
+        self.path = path
+        self.size = size
+        self._df = None
+        self._fingerprint = None
+        # (offset, digest of the bytes before) of the last row loaded
+        self._last_row = None
+        self.lock = threading.Lock()
+
+    #----------------------------------------------------------------------
+    def load_all(self, data: bytes):
+        """load and calculate all the rows"""
+        df = prepare_index_frame(load_vix_by_csv(io.BytesIO(data)))
+        close_ma5_ma10_ma20(df)
+        historical_max_min_per(df)
+        df['per'] = rolling_percent_distribution(df[CLOSE_PRICE_NAME])
+        return df
+
+    #----------------------------------------------------------------------
+    def read_tail(self, data: bytes):
+        """parse the rows from the last row loaded, None if the rows before
+        it are changed"""
+        if self._last_row is None:
+            return None
+        offset, digest = self._last_row
+        # reading the bytes is cheap, parsing and calculating are not
+        if hashlib.sha1(data[:offset]).digest() != digest:
+            return None
+        header = data[:data.find(b'\n') + 1]
+        return load_vix_by_csv(io.BytesIO(header + data[offset:]))
+
+    #----------------------------------------------------------------------
+    def apply(self, rows: pd.DataFrame):
+        """apply the rows from the last loaded one, the ones before them are
+        kept, the calculated columns are continued from them"""
+        df = self._df
+        # the last row loaded may be revised
+        kept = df[df.index < rows.index[0]]
+        rows = prepare_index_frame(rows)
+        if rows.empty:
+            return kept
+        start = kept.shape[0]
+        if start == 0:
+            return None
+        df = pd.concat([kept, rows.reindex(columns = df.columns)])
+        closes = df[CLOSE_PRICE_NAME]
+        # the moving averages only need the last closes before start
+        ma_start = max(start - MA_WINDOW, 0)
+        mas = close_ma5_ma10_ma20(closes.iloc[ma_start:].to_frame())
+        for col in ['ma5', 'ma10', 'ma20']:
+            df.loc[df.index[start:], col] = mas[col].iloc[start - ma_start:].to_numpy()
+        historical_max_min_per(df, start)
+        fix_mper_dtype(df)
+        # the percentage of the window, warmed up by the values before start
+        engine = RollingPercentile(self.size)
+        values = closes.to_numpy(dtype = float)
+        engine.extend(values[max(start - self.size + 1, 0):start])
+        df.loc[df.index[start:], 'per'] = engine.extend(values[start:])
+        return df
+
+    #----------------------------------------------------------------------
+    def remember_tail(self, data: bytes):
+        """remember the offset of the last row and the digest of the rows
+        before it"""
+        header_end = data.find(b'\n') + 1
+        offset = data.rstrip(b'\r\n').rfind(b'\n') + 1
+        if header_end <= 0 or offset <= header_end:
+            # no rows
+            self._last_row = None
+        else:
+            self._last_row = (offset, hashlib.sha1(data[:offset]).digest())
+
+    #----------------------------------------------------------------------
+    def load(self):
+        """the analyzed frame, only the new rows are calculated if the file
+        grows"""
+        fingerprint = file_fingerprint(self.path)
+        if fingerprint == self._fingerprint:
+            return self._df
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        df = None
+        if self._df is not None:
+            rows = self.read_tail(data)
+            if rows is not None:
+                df = self.apply(rows)
+        if df is None:
+            df = self.load_all(data)
+        self._df = df
+        self._fingerprint = fingerprint
+        self.remember_tail(data)
+        return df
+
+
+#----------------------------------------------------------------------
+class ResidentStore():
+    """the resident frames of the index files, shared by the data managers
+    of the long running process"""
+
+    def __init__(self):
+        """Constructor"""
+        self._lock = threading.Lock()
+        self._frames = {}
+
+    #----------------------------------------------------------------------
+    def get(self, path: str):
+        """get the resident frame of the file"""
+        key = os.path.abspath(path)
+        with self._lock:
+            if key not in self._frames:
+                self._frames[key] = ResidentFrame(path)
+            return self._frames[key]
+
+    #----------------------------------------------------------------------
+    def load(self, path: str):
+        """the analyzed frame of the file, a copy to be changed freely"""
+        frame = self.get(path)
+        with frame.lock:
+            return frame.load().copy(deep = False)
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """drop all the frames"""
+        with self._lock:
+            self._frames = {}
+
+
+# the frames of the index files
+resident_store = ResidentStore()
@@ -0,0 +1,66 @@
+# encoding: UTF-8
+
+from .utilities import file_fingerprint
+
+import os, threading, collections
+
+
+# results kept in memory
+RESULT_CACHE_CAPACITY = 16
+
+
+#----------------------------------------------------------------------
+def files_fingerprint(path: str, exts: tuple = ('.csv', '.npy')):
+    """the fingerprint of all the files with exts under path, it changes if
+    any of them is added, removed or changed"""
+    if not os.path.isdir(path):
+        return ()
+    fingerprints = []
+    for entry in os.scandir(path):
+        if os.path.splitext(entry.name)[1] in exts and entry.is_file():
+            fingerprints.append((entry.name, ) + file_fingerprint(entry.path))
+    return tuple(sorted(fingerprints))
+
+
+#----------------------------------------------------------------------
+class ResultCache():
+    """LRU cache of the results calculated from the files
+
+    the key has the fingerprints of the input files, so a result is used only
+    if none of the inputs changed."""
+
+    def __init__(self, capacity: int = RESULT_CACHE_CAPACITY):
+        """Constructor"""
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items = collections.OrderedDict()
+
+    #----------------------------------------------------------------------
+    def put(self, key: tuple, value):
+        """keep the result, the least recently used ones are evicted"""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last = False)
+
+    #----------------------------------------------------------------------
+    def get(self, key: tuple, calc: callable):
+        """get the cached result of the key or calculate it by calc()"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = calc()
+        self.put(key, value)
+        return value
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """drop all the results in memory"""
+        with self._lock:
+            self._items.clear()
+
+
+# the analysis of the data managers
+analysis_cache = ResultCache()
@@ -1,13 +1,26 @@
 # encoding: UTF-8
 
 from .singleton import Singleton
-import threading
+from .logger import logger
+import threading, heapq, itertools, random, time, traceback
+from functools import lru_cache
 from crontab import CronTab
 
 
 # crontab may cause an advance trigger, so we need to delay a little
 CRONTAB_MIN_DELAY = 1          # delay for the schedule
 CRONTAB_DOIT_MIN_DELAY = 10    # delay for the doing
+# re_delay is 5 minutes when failed
+RETRY_DELAY = 300
+# the seq of the job being fired
+_RUNNING = -1
+
+
+#----------------------------------------------------------------------
+@lru_cache(maxsize = None)
+def get_crontab(cronTab: str):
+    """the parsed crontab, it's parsed once"""
+    return CronTab(cronTab)
 
 
 #----------------------------------------------------------------------
@@ -21,41 +34,188 @@ def get_delay_time(cronTab):
     |  +------- hour (0 - 23)
     +-------- min (0 - 59)
     """
-    entry = CronTab(cronTab)
+    entry = get_crontab(cronTab)
     return max(int(entry.next(default_utc = True)), CRONTAB_MIN_DELAY)
 
 
+#----------------------------------------------------------------------
+class Scheduler():
+    """one thread firing all the jobs
+
+    the next fire times of the jobs are kept in a heap, the thread sleeps
+    until the earliest one, the due jobs run one by one ordered by the
+    priority. a job is any object with timeout(doit) returning the seconds
+    to the next fire."""
+
+    def __init__(self):
+        """Constructor"""
+        self._cond = threading.Condition()
+        # (fire time, priority, seq, job, doit)
+        self._heap = []
+        # the seq of the valid entry of each job
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._stopped = False
+        self._thread = None
+
+    #----------------------------------------------------------------------
+    def add(self, job, delay: float, priority: int = 0, doit: bool = True):
+        """fire the job after delay seconds, the former fire of it is
+        replaced"""
+        with self._cond:
+            seq = next(self._seq)
+            self._jobs[job] = seq
+            heapq.heappush(self._heap, (time.monotonic() + delay, priority, seq, job, doit))
+            self.start()
+            self._cond.notify()
+
+    #----------------------------------------------------------------------
+    def remove(self, job):
+        """cancel the next fire of the job"""
+        with self._cond:
+            self._jobs.pop(job, None)
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """start the thread if not started, called with the lock held"""
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target = self.run, name = 'Scheduler',
+                                            daemon = True)
+            self._thread.start()
+
+    #----------------------------------------------------------------------
+    def next_due(self):
+        """wait for the next due job, the one with the smallest priority of
+        the due jobs, None if stopped"""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    entry = heapq.heappop(self._heap)
+                    # the removed or replaced ones are dropped
+                    if self._jobs.get(entry[3]) == entry[2]:
+                        due.append(entry)
+                if not due:
+                    continue
+                due.sort(key = lambda entry: (entry[1], entry[0], entry[2]))
+                for entry in due[1:]:
+                    heapq.heappush(self._heap, entry)
+                fire_time, priority, seq, job, doit = due[0]
+                self._jobs[job] = _RUNNING
+                return job, priority, doit
+            return None
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """fire the jobs until stopped"""
+        while True:
+            due = self.next_due()
+            if due is None:
+                break
+            job, priority, doit = due
+            try:
+                delay = job.timeout(doit)
+            except Exception:
+                logger.error(f'{type(job).__name__} failed: {traceback.format_exc()}')
+                delay = RETRY_DELAY
+            with self._cond:
+                if self._stopped or self._jobs.get(job) != _RUNNING:
+                    # stopped, removed or added again while running
+                    continue
+            self.add(job, delay, priority)
+        logger.info('scheduler stopped. ')
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """stop firing, the running job is finished"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    #----------------------------------------------------------------------
+    def is_running(self):
+        """check if the thread is running"""
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    #----------------------------------------------------------------------
+    def join(self, timeout: float = None):
+        """wait for the thread"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+#----------------------------------------------------------------------
+def get_scheduler():
+    """get the process wide scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+
 #----------------------------------------------------------------------
 class ScheduleManager(metaclass = Singleton):
     # minute hour day month weekday
     # '0 0 * * *'
     _crontab = '0 0 * * *'
-    _thread = None
+    # the smaller one runs first when due at the same time
+    _priority = 10
+    # the max random seconds added to the delay
+    _jitter = 0
 
     def __init__(self, doit: bool = False):
         """ Constructor """
         super(ScheduleManager, self).__init__()
-        self.timeout(doit)
+        self._scheduler = get_scheduler()
+        if doit:
+            # do it in the scheduler at once
+            self._scheduler.add(self, 0, self._priority)
+        else:
+            self._scheduler.add(self, self.get_fire_delay(), self._priority)
 
     def get_delay_time(self):
         """get the delay time for the next action"""
         return get_delay_time(self._crontab)
 
+    def get_fire_delay(self, delay: float = None):
+        """the delay with the jitter"""
+        if delay is None:
+            delay = self.get_delay_time()
+        if self._jitter > 0:
+            delay += random.uniform(0, self._jitter)
+        return delay
+
+    def get_retry_delay(self):
+        """get the delay time to retry when failed"""
+        return RETRY_DELAY
+
     def timeout(self, doit: bool = True):
-        """when time out"""
-        self.cancel_timer()
+        """when time out, returns the seconds to the next time out"""
         delay = self.get_delay_time()
         if True == doit and delay > CRONTAB_DOIT_MIN_DELAY:
             if not self.do_timeout():
-                # re_delay is 5 minutes
-                delay = 300
-        self._thread = threading.Timer(delay, self.timeout)
-        self._thread.start()
+                delay = self.get_retry_delay()
+            else:
+                # the next fire may be changed by the done one
+                delay = self.get_delay_time()
+        return self.get_fire_delay(delay)
 
     def cancel_timer(self):
-        if self._thread:
-            self._thread.cancel()
-            self._thread = None
+        self._scheduler.remove(self)
 
     def do_timeout(self):
         """we do sth in this function"""
@@ -0,0 +1,162 @@
+# encoding: UTF-8
+
+from .utilities import make_sure_dirs_exist
+from .logger import logger
+
+import os, threading
+import numpy as np
+
+
+SNAPSHOT_RING_FILE = 'intraday.npy'
+# the snapshot rows kept, about 2 months of the vx contracts polled every
+# 15 minutes
+SNAPSHOT_RING_CAPACITY = 1 << 16
+# one row for each contract of each poll, seq is 0 for the empty rows
+SNAPSHOT_DTYPE = np.dtype([('seq', 'int64'),
+                           ('timestamp', 'datetime64[s]'),
+                           ('symbol', 'U16'),
+                           ('last', 'float64'),
+                           ('high', 'float64'),
+                           ('low', 'float64'),
+                           ('volume', 'int64'),
+                           ('prev_settlement', 'float64')])
+# the payload keys of the fields
+SNAPSHOT_FIELDS = (('last', 'last_price'), ('high', 'high'), ('low', 'low'),
+                   ('prev_settlement', 'prev_settlement'))
+# the volume of the contract without volume info
+NO_VOLUME = -1
+
+
+#----------------------------------------------------------------------
+def to_float(value):
+    """the float of the quote field, nan if it's missing"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+#----------------------------------------------------------------------
+def to_volume(value):
+    """the volume of the quote field, NO_VOLUME if it's missing"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NO_VOLUME
+
+
+#----------------------------------------------------------------------
+class SnapshotRing():
+    """fixed size ring buffer of the intraday snapshots
+
+    the rows are kept in one numpy structured array saved as .npy and memory
+    mapped for writing, so the history survives the restarts and the memory
+    is bounded by the capacity. each row has an increasing seq, the newest
+    one tells where to write next after loaded. the readers get the views of
+    the memory map, nothing is copied."""
+
+    def __init__(self, path: str, capacity: int = SNAPSHOT_RING_CAPACITY):
+        """Constructor"""
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.load()
+
+    #----------------------------------------------------------------------
+    def load(self):
+        """load the ring by memory map, it's created if it's missing or
+        broken"""
+        self._data = None
+        if os.path.exists(self.path):
+            try:
+                data = np.load(self.path, mmap_mode = 'r+')
+                if data.dtype == SNAPSHOT_DTYPE and 1 == data.ndim and data.size > 0:
+                    self._data = data
+                else:
+                    logger.error(f'{self.path} is not a snapshot ring, recreated. ')
+            except (ValueError, OSError):
+                logger.error(f'{self.path} is broken, recreated. ')
+        if self._data is None:
+            make_sure_dirs_exist(os.path.dirname(self.path))
+            self._data = np.lib.format.open_memmap(self.path, mode = 'w+',
+                                                   dtype = SNAPSHOT_DTYPE,
+                                                   shape = (self.capacity, ))
+        # the capacity of the existed ring is kept
+        self.capacity = self._data.size
+        newest = int(np.argmax(self._data['seq']))
+        self._seq = int(self._data['seq'][newest])
+        self._pos = (newest + 1) % self.capacity if self._seq > 0 else 0
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """the count of the rows kept"""
+        return min(self._seq, self.capacity)
+
+    #----------------------------------------------------------------------
+    def make_rows(self, timestamp, items: list):
+        """the snapshot rows of the quote items of the payload, the timestamp
+        is the epoch seconds or the datetime64"""
+        rows = np.zeros(len(items), dtype = SNAPSHOT_DTYPE)
+        rows['timestamp'] = np.datetime64(timestamp, 's')
+        rows['symbol'] = [item.get('symbol', '') for item in items]
+        for name, key in SNAPSHOT_FIELDS:
+            rows[name] = [to_float(item.get(key)) for item in items]
+        rows['volume'] = [to_volume(item.get('volume')) for item in items]
+        return rows
+
+    #----------------------------------------------------------------------
+    def append(self, timestamp, items: list):
+        """append the snapshot of the quote items at the timestamp, the
+        oldest rows are overwritten when it's full"""
+        if not items:
+            return
+        rows = self.make_rows(timestamp, items)
+        if rows.size > self.capacity:
+            rows = rows[-self.capacity:]
+        with self._lock:
+            rows['seq'] = np.arange(self._seq + 1, self._seq + 1 + rows.size)
+            positions = (self._pos + np.arange(rows.size)) % self.capacity
+            self._data[positions] = rows
+            self._data.flush()
+            self._seq += rows.size
+            self._pos = (self._pos + rows.size) % self.capacity
+
+    #----------------------------------------------------------------------
+    def views(self):
+        """the kept rows from the older to the newer, as at most two views of
+        the memory map"""
+        with self._lock:
+            if self._seq < self.capacity:
+                return [self._data[:self._pos]]
+            return [self._data[self._pos:], self._data[:self._pos]]
+
+    #----------------------------------------------------------------------
+    def last_snapshot(self):
+        """the copy of the rows of the newest snapshot"""
+        with self._lock:
+            if 0 == self._seq:
+                return self._data[:0]
+            newest = (self._pos - 1) % self.capacity
+            timestamp = self._data['timestamp'][newest]
+        rows = [view[view['timestamp'] == timestamp] for view in self.views()]
+        return np.concatenate(rows)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """flush and release the memory map"""
+        with self._lock:
+            self._data.flush()
+            self._data = None
+
+
+#----------------------------------------------------------------------
+def snapshot_to_items(rows: np.ndarray):
+    """the quote items of the snapshot rows, as the ones of the payload"""
+    items = []
+    for row in rows:
+        item = {'symbol': str(row['symbol'])}
+        for name, key in SNAPSHOT_FIELDS:
+            item[key] = float(row[name])
+        item['volume'] = '-' if NO_VOLUME == row['volume'] else int(row['volume'])
+        items.append(item)
+    return items
@@ -0,0 +1,66 @@
+# encoding: UTF-8
+
+from .logger import logger
+
+import threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+#----------------------------------------------------------------------
+class StagedExecutor():
+    """run the independent stages in parallel and join them
+
+    a stage fails if it raises or returns None, the results of the done
+    stages are kept until cleared, so a retry only runs the failed ones."""
+
+    def __init__(self):
+        """Constructor"""
+        self._lock = threading.Lock()
+        self._results = {}
+
+    #----------------------------------------------------------------------
+    def is_done(self, name: str):
+        """check if the stage is done"""
+        with self._lock:
+            return name in self._results
+
+    #----------------------------------------------------------------------
+    def get(self, name: str):
+        """the result of the done stage, None if it's not done"""
+        with self._lock:
+            return self._results.get(name)
+
+    #----------------------------------------------------------------------
+    def run_stage(self, name: str, func: callable):
+        """run the stage and keep the result"""
+        try:
+            result = func()
+        except Exception:
+            logger.error(f'stage {name} failed: {traceback.format_exc()}')
+            return False
+        if result is None:
+            return False
+        with self._lock:
+            self._results[name] = result
+        return True
+
+    #----------------------------------------------------------------------
+    def run(self, stages: dict):
+        """run the stages of {name: func} not done yet at the same time,
+        returns True if all of them are done"""
+        pending = [(name, func) for name, func in stages.items()
+                   if not self.is_done(name)]
+        if len(pending) == 1:
+            self.run_stage(*pending[0])
+        elif pending:
+            with ThreadPoolExecutor(max_workers = len(pending),
+                                    thread_name_prefix = 'stage') as executor:
+                for name, func in pending:
+                    executor.submit(self.run_stage, name, func)
+        return all(self.is_done(name) for name in stages)
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """drop all the results"""
+        with self._lock:
+            self._results = {}
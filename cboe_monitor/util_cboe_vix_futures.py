@@ -2,6 +2,9 @@
 
 import json
 from enum import Enum
+import numpy as np
+import pandas as pd
+from .logger import logger
 
 
 #----------------------------------------------------------------------
@@ -15,15 +18,31 @@ class VixIntradayState(Enum):
 
 
 VIX_FUTURES_URL = "https://markets.cboe.com/us/futures/api/get_quotes_combined/?symbol=VX&rootsymbol=VIX"
+# the contracts with less volume are not checked
+INTRADAY_MIN_VOLUME = 100
+# the unusual move is max(prev_close * per, min)
+INTRADAY_DELTA_PER = 0.1
+INTRADAY_DELTA_MIN = 5
+# (ratio to the unusual move, poll delay), the nearer the faster
+INTRADAY_POLL_DELAYS = ((0.8, 30), (0.5, 120))
+INTRADAY_POLL_DELAY = 900
+# the quote fields converted to the column arrays, the missing ones are 0 as
+# check_vix_intraday_warning does
+INTRADAY_COLUMNS = ('high', 'low', 'last_price', 'prev_settlement')
+
+
+#----------------------------------------------------------------------
+def calc_unusual_delta(prev_close: float, per_aa: float, min_aa: float, test: bool = False):
+    """the move from the prev close to be unusual"""
+    if test:
+        return 0.1
+    return max(prev_close * per_aa, min_aa)
 
 
 #----------------------------------------------------------------------
 def check_unusual(prev_close: float, high: float, low: float, close: float,
                   per_aa: float, min_aa: float, test: bool = False):
-    if test:
-        delta_aa = 0.1
-    else:
-        delta_aa = max(prev_close * per_aa, min_aa)
+    delta_aa = calc_unusual_delta(prev_close, per_aa, min_aa, test)
     pin_aa = delta_aa * 2 / 3
     if high - prev_close >= delta_aa:
         # up to at least aa, this is unusal
@@ -42,12 +61,18 @@ def check_unusual(prev_close: float, high: float, low: float, close: float,
     return VixIntradayState.Normal
 
 
+#----------------------------------------------------------------------
+def has_enough_volume(item: dict):
+    """no volume info or volume is too low, it's not checked"""
+    return item.get('volume') != '-' and int(item.get('volume')) >= INTRADAY_MIN_VOLUME
+
+
 #----------------------------------------------------------------------
 def check_vix_intraday_warning(rets, test: bool = False):
     values = rets.get('data')
     infos = []
     for item in values:
-        if item.get('volume') == '-' or int(item.get('volume')) < 100:
+        if not has_enough_volume(item):
             # no volume info or volume is too low, pass it
             continue
         high = float(item.get('high', 0))
@@ -55,7 +80,8 @@ def check_vix_intraday_warning(rets, test: bool = False):
         close = float(item.get('last_price', 0))
         # item.get('settlement')
         prev_close = float(item.get('prev_settlement', 0))
-        check_ret = check_unusual(prev_close, high, low, close, 0.1, 5, test)
+        check_ret = check_unusual(prev_close, high, low, close,
+                                  INTRADAY_DELTA_PER, INTRADAY_DELTA_MIN, test)
         if check_ret != VixIntradayState.Normal:
             item['high'] = high
             item['low'] = low
@@ -65,6 +91,92 @@ def check_vix_intraday_warning(rets, test: bool = False):
     return infos
 
 
+#----------------------------------------------------------------------
+def quotes_to_columns(values: list):
+    """convert the quote items to the float column arrays once, the unparsed
+    values are nan, so is the volume of '-'. the contracts of the unparsed
+    volume are not checked, they are logged"""
+    columns = {key: pd.to_numeric(np.array([item.get(key, 0) for item in values], dtype = object),
+                                  errors = 'coerce').astype(float)
+               for key in INTRADAY_COLUMNS}
+    volumes = np.array([item.get('volume') for item in values], dtype = object)
+    columns['volume'] = pd.to_numeric(volumes, errors = 'coerce').astype(float)
+    unparsed = np.isnan(columns['volume']) & (volumes != '-')
+    for idx in np.flatnonzero(unparsed):
+        logger.warning(f"the volume {volumes[idx]!r} of {values[idx].get('symbol')} "
+                       f"is not a number, it's not checked. ")
+    return columns
+
+
+#----------------------------------------------------------------------
+def calc_unusual_deltas(prev_close: np.ndarray, per_aa: float, min_aa: float, test: bool = False):
+    """the moves from the prev closes to be unusual"""
+    if test:
+        return np.full(prev_close.shape, 0.1)
+    return np.maximum(prev_close * per_aa, min_aa)
+
+
+#----------------------------------------------------------------------
+def calc_intraday_states(columns: dict, test: bool = False):
+    """the state values of all the contracts by the masks, the same as
+    check_unusual, the contracts without enough volume are Normal"""
+    prev_close = columns['prev_settlement']
+    high, low, close = columns['high'], columns['low'], columns['last_price']
+    delta_aa = calc_unusual_deltas(prev_close, INTRADAY_DELTA_PER, INTRADAY_DELTA_MIN, test)
+    pin_aa = delta_aa * 2 / 3
+    checked = columns['volume'] >= INTRADAY_MIN_VOLUME
+    up = checked & (high - prev_close >= delta_aa)
+    down = checked & ~up & (np.abs(prev_close - low) >= delta_aa)
+    states = np.full(prev_close.shape, VixIntradayState.Normal.value, dtype = np.int8)
+    states[up] = np.where(high - close >= pin_aa, VixIntradayState.PinUp.value,
+                          VixIntradayState.High.value)[up]
+    states[down] = np.where(close - low >= pin_aa, VixIntradayState.PinDown.value,
+                            VixIntradayState.Low.value)[down]
+    return states
+
+
+#----------------------------------------------------------------------
+def batch_check_vix_intraday_warning(rets, test: bool = False, columns: dict = None):
+    """the same as check_vix_intraday_warning, evaluated by the column
+    arrays, the items of the warnings are copied with the float prices, the
+    input is not changed"""
+    values = rets.get('data')
+    if columns is None:
+        columns = quotes_to_columns(values)
+    states = calc_intraday_states(columns, test)
+    infos = []
+    for idx in np.flatnonzero(states != VixIntradayState.Normal.value):
+        item = dict(values[idx])
+        for key in INTRADAY_COLUMNS:
+            item[key] = float(columns[key][idx])
+        infos.append((VixIntradayState(states[idx]), item))
+    return infos
+
+
+#----------------------------------------------------------------------
+def calc_intraday_ratio(rets, test: bool = False, columns: dict = None):
+    """the max ratio of the contracts' move to the unusual move, it's
+    unusual if it's not less than 1"""
+    if columns is None:
+        columns = quotes_to_columns(rets.get('data'))
+    prev_close = columns['prev_settlement']
+    checked = columns['volume'] >= INTRADAY_MIN_VOLUME
+    move = np.maximum(columns['high'] - prev_close, np.abs(prev_close - columns['low']))
+    ratios = move[checked] / calc_unusual_deltas(prev_close[checked], INTRADAY_DELTA_PER,
+                                                 INTRADAY_DELTA_MIN, test)
+    ratios = ratios[~np.isnan(ratios)]
+    return max(0, float(ratios.max())) if ratios.size else 0
+
+
+#----------------------------------------------------------------------
+def get_intraday_delay(ratio: float):
+    """the poll delay by the ratio to the unusual move"""
+    for near, delay in INTRADAY_POLL_DELAYS:
+        if ratio >= near:
+            return delay
+    return INTRADAY_POLL_DELAY
+
+
 #----------------------------------------------------------------------
 def mk_intraday_notification(infos):
     """make the intraday vix warning info"""
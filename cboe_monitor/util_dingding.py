@@ -5,6 +5,7 @@ import time, hmac, hashlib, base64, urllib.parse
 import requests, threading, traceback, json
 
 from .utilities import DATA_ROOT
+from .util_http_bs4 import http_post
 from .logger import logger
 
 
@@ -45,7 +46,7 @@ def do_send_msg(msg: str):
     timestamp = generate_timestamp()
     sign = generate_sign(timestamp)
     try:
-        response = requests.post(
+        response = http_post(
             dd_url + f'&timestamp={timestamp}&sign={sign}',
             headers = headers, data = json.dumps(msg))
         res = json.loads(response.content)
@@ -53,7 +54,7 @@ def do_send_msg(msg: str):
             logger.error(res)
         else:
             logger.info(res)
-    except requests.exceptions.ConnectionError:
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         logger.error(traceback.format_exc(limit = 1))
 
 
@@ -1,14 +1,193 @@
 # encoding: UTF-8
 
-import requests, traceback, json
+import requests, traceback, json, threading, os
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+from .utilities import atomic_write
 from .logger import logger
 
 
+# connections kept alive for each host
+HTTP_POOL_SIZE = 10
+# seconds for connecting and reading
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 60
+HTTP_HEADERS = {'Accept-Encoding': 'gzip, deflate',
+                'Connection': 'keep-alive'}
+
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+
+#----------------------------------------------------------------------
+def set_http_timeout(connect: float = None, read: float = None):
+    """set the connect and read timeout of all the http requests"""
+    global HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+    if connect is not None:
+        HTTP_CONNECT_TIMEOUT = connect
+    if read is not None:
+        HTTP_READ_TIMEOUT = read
+
+
+#----------------------------------------------------------------------
+def get_http_timeout():
+    """get the (connect, read) timeout"""
+    return HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+
+
+#----------------------------------------------------------------------
+def get_session(pool_size: int = HTTP_POOL_SIZE):
+    """get the process wide http session, the connection pool is enlarged
+    to pool_size if it's smaller, the connections of the old pool are
+    closed"""
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HTTP_HEADERS)
+        if pool_size > _session_pool_size:
+            old_adapters = {id(adapter): adapter for prefix, adapter in _session.adapters.items()
+                            if prefix in ('https://', 'http://')}
+            adapter = HTTPAdapter(pool_connections = pool_size,
+                                  pool_maxsize = pool_size)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session_pool_size = pool_size
+            for old in old_adapters.values():
+                old.close()
+        return _session
+
+
+#----------------------------------------------------------------------
+def http_get(url: str, **kwargs):
+    """get by the shared session"""
+    kwargs.setdefault('timeout', get_http_timeout())
+    return get_session().get(url, **kwargs)
+
+
+#----------------------------------------------------------------------
+def http_head(url: str, **kwargs):
+    """head by the shared session"""
+    kwargs.setdefault('timeout', get_http_timeout())
+    return get_session().head(url, **kwargs)
+
+
+#----------------------------------------------------------------------
+def http_post(url: str, **kwargs):
+    """post by the shared session"""
+    kwargs.setdefault('timeout', get_http_timeout())
+    return get_session().post(url, **kwargs)
+
+
+#----------------------------------------------------------------------
+class HttpValidatorCache():
+    """the ETag and Last-Modified of the downloaded urls, for the conditional
+    requests, the immutable urls are never requested again"""
+
+    def __init__(self, path: str = None):
+        """Constructor"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._items = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as file:
+                    self._items = json.load(file)
+            except ValueError:
+                logger.error(f'{path} is broken, ignored. ')
+
+    #----------------------------------------------------------------------
+    def get_headers(self, url: str):
+        """the conditional headers of the url"""
+        with self._lock:
+            item = self._items.get(url, {})
+        headers = {}
+        if item.get('etag'):
+            headers['If-None-Match'] = item['etag']
+        if item.get('last_modified'):
+            headers['If-Modified-Since'] = item['last_modified']
+        return headers
+
+    #----------------------------------------------------------------------
+    def update(self, url: str, response: requests.Response):
+        """keep the validators of the response"""
+        with self._lock:
+            item = self._items.setdefault(url, {})
+            item['etag'] = response.headers.get('ETag')
+            item['last_modified'] = response.headers.get('Last-Modified')
+
+    #----------------------------------------------------------------------
+    def set_immutable(self, url: str):
+        """the url is never changed"""
+        with self._lock:
+            self._items.setdefault(url, {})['immutable'] = True
+
+    #----------------------------------------------------------------------
+    def is_immutable(self, url: str):
+        """check if the url is never changed"""
+        with self._lock:
+            return self._items.get(url, {}).get('immutable', False)
+
+    #----------------------------------------------------------------------
+    def save(self):
+        """save the validators"""
+        if not self.path:
+            return
+        def write(tmp_path: str):
+            with open(tmp_path, 'w') as file:
+                json.dump(self._items, file)
+        with self._lock:
+            atomic_write(self.path, write)
+
+
+#----------------------------------------------------------------------
+def conditional_get(url: str, cache: HttpValidatorCache = None,
+                    conditional: bool = True):
+    """get the url with the cached validators, the status code of the
+    response is 304 if the url is not modified"""
+    headers = {}
+    if cache is not None and conditional:
+        headers = cache.get_headers(url)
+    response = http_get(url, headers = headers)
+    if 304 == response.status_code:
+        return response
+    response.raise_for_status()
+    if cache is not None:
+        cache.update(url, response)
+    return response
+
+
+#----------------------------------------------------------------------
+def probe_modified(url: str, cache: HttpValidatorCache):
+    """probe the url by a HEAD request with the cached validators, True if
+    it's modified since the last probe or it's unknown, the validators of the
+    cache are updated"""
+    headers = cache.get_headers(url)
+    try:
+        response = http_head(url, headers = headers)
+    except requests.exceptions.RequestException:
+        logger.error(f"http head failed. {traceback.format_exc(limit = 0)}")
+        return True
+    if 304 == response.status_code:
+        return False
+    if not response.ok:
+        return True
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    cache.update(url, response)
+    if not etag and not last_modified:
+        # no validators, it can't be told
+        return True
+    # some servers ignore the conditional headers of HEAD
+    return etag != headers.get('If-None-Match') or \
+        last_modified != headers.get('If-Modified-Since')
+
+
 #----------------------------------------------------------------------
 def get_content(url: str, parse: callable):
     try:
-        response = requests.get(url)
+        response = http_get(url)
         response.raise_for_status()
         rets = parse(response)
         return rets
@@ -18,6 +18,7 @@ global wechat_lock
 wechat_lock = Lock()
 
 from .utilities import DATA_ROOT
+from .util_http_bs4 import http_post
 
 ini_config = configparser.ConfigParser()
 PUSH_CONFIG_PATH = os.path.join(DATA_ROOT, 'push.ini')
@@ -54,7 +55,7 @@ class WxPusherThread(Thread):
         params['url'] = self.url
         # try to send the msg
         try:
-            response = requests.post(self.request_url, json = params).json()
+            response = http_post(self.request_url, json = params).json()
             if not response.get('success', False):
                 logger.info(response)
                 return
@@ -1,6 +1,7 @@
 # encoding: UTF-8
 
-import os, sys, datetime, hashlib, glob, re
+import os, sys, datetime, hashlib, glob, re, bisect, collections, json, threading, \
+    tempfile, stat
 import pandas as pd
 import numpy as np
 import pandas_market_calendars as market_cal
@@ -21,6 +22,17 @@ DAILY_UPDATE_HOUR = 23
 ONE_DAY = datetime.timedelta(days = 1)
 SEVEN_DAYS = datetime.timedelta(days = 7)
 TZ_INFO = 'America/Chicago'
+# the cfe session of a trading day is from the evening before to the
+# afternoon of the day, chicago time
+CFE_OPEN_HOUR = 17
+CFE_CLOSE_HOUR = 16
+# the first month of the delivery calendar
+CALENDAR_START = datetime.date(2013, 1, 1)
+# about 14 months later
+CALENDAR_HORIZON = datetime.timedelta(days = 420)
+CALENDAR_FILE = 'calendar.json'
+# the holidays from this long before today are checked again every day
+HOLIDAY_RECHECK_DAYS = datetime.timedelta(days = 30)
 
 # data root
 DATA_ROOT = './data'
@@ -43,6 +55,15 @@ LOW_PRICE_NAME   = 'Low'
 CLOSE_PRICE_NAME = 'Close'
 VOLUME_NAME      = 'Volume'
 
+# read buffer for hashing files
+HASH_BUFFER_SIZE = 1024 * 1024
+# the suffix of the file being written, it's renamed to the target when done
+TEMP_FILE_SUFFIX = '.tmp'
+# the mode of the newly written data files
+DATA_FILE_MODE = 0o644
+# the suffix of the journal of the in place write
+JOURNAL_FILE_SUFFIX = '.journal'
+
 # about 3 years
 HV_DISTRIBUTION_PERIODS = 260 * 3
 
@@ -55,13 +76,92 @@ MD_FORMAT_TO = r'\n\n'
 
 
 #----------------------------------------------------------------------
-def is_business_day(input_date: datetime.datetime, schedule_days):
-    if isinstance(input_date, datetime.datetime):
-        input_date_str = input_date.strftime(DATE_FORMAT)
-    else:
-        input_date_str = input_date
-    holiday_check = cboe_calendar.open_at_time(schedule_days, pd.Timestamp(input_date_str + ' 12:00', tz=TZ_INFO))
-    return holiday_check
+def to_datetime64(dates):
+    """convert date str, date, datetime or their arrays to datetime64[D]"""
+    if isinstance(dates, datetime.date):
+        dates = dates.strftime(DATE_FORMAT)
+    if isinstance(dates, str):
+        return np.datetime64(dates, 'D')
+    return np.asarray(dates, dtype = 'datetime64[D]')
+
+
+#----------------------------------------------------------------------
+class TradingCalendar():
+    """the business days of the calendar
+
+    the open days are kept by numpy's busday calendar, a weekday mask plus the
+    sorted datetime64 holidays, so all the lookups are vectorized."""
+
+    def __init__(self, holidays = []):
+        """Constructor"""
+        self.holidays = np.unique(to_datetime64(list(holidays)))
+        self._busdaycal = np.busdaycalendar(holidays = self.holidays)
+
+    #----------------------------------------------------------------------
+    def is_open(self, dates):
+        """check if the date or dates are business days"""
+        return np.is_busday(to_datetime64(dates), busdaycal = self._busdaycal)
+
+    #----------------------------------------------------------------------
+    def rollback(self, dates):
+        """the date itself if it's a business day, else the one before"""
+        return np.busday_offset(to_datetime64(dates), 0, roll = 'backward',
+                                busdaycal = self._busdaycal)
+
+    #----------------------------------------------------------------------
+    def previous_day(self, dates):
+        """the business day before the date"""
+        return np.busday_offset(to_datetime64(dates), -1, roll = 'forward',
+                                busdaycal = self._busdaycal)
+
+    #----------------------------------------------------------------------
+    def next_day(self, dates):
+        """the business day after the date"""
+        return np.busday_offset(to_datetime64(dates), 1, roll = 'backward',
+                                busdaycal = self._busdaycal)
+
+    #----------------------------------------------------------------------
+    def last_n_days(self, n: int, current):
+        """the last n business days until current"""
+        return np.busday_offset(to_datetime64(current), np.arange(1 - n, 1),
+                                roll = 'backward', busdaycal = self._busdaycal)
+
+    #----------------------------------------------------------------------
+    def days_between(self, start, end):
+        """the business days between start and end"""
+        days = np.arange(to_datetime64(start), to_datetime64(end) + 1)
+        return days[self.is_open(days)]
+
+
+#----------------------------------------------------------------------
+def is_business_day(input_date: datetime.datetime, calendar: TradingCalendar):
+    """check if the input date is a business day"""
+    return bool(calendar.is_open(input_date))
+
+
+#----------------------------------------------------------------------
+def get_cfe_session(current: datetime.datetime, calendar: TradingCalendar):
+    """the (open, close) of the cfe session of the aware current, the next
+    session if it's closed"""
+    local = pd.Timestamp(current).tz_convert(TZ_INFO)
+    day = local.date()
+    if local.hour >= CFE_CLOSE_HOUR:
+        day += ONE_DAY
+    # the day itself if it's a business day, else the next one
+    day = pd.Timestamp(calendar.next_day(day - ONE_DAY)).date()
+    open_time = datetime.datetime.combine(day - ONE_DAY, datetime.time(CFE_OPEN_HOUR))
+    close_time = datetime.datetime.combine(day, datetime.time(CFE_CLOSE_HOUR))
+    return pd.Timestamp(open_time).tz_localize(TZ_INFO), \
+        pd.Timestamp(close_time).tz_localize(TZ_INFO)
+
+
+#----------------------------------------------------------------------
+def get_cfe_closed_delay(calendar: TradingCalendar, current: datetime.datetime = None):
+    """the seconds to the next cfe session, 0 if it's open"""
+    if current is None:
+        current = datetime.datetime.now(tz = datetime.timezone.utc)
+    open_time, close_time = get_cfe_session(current, calendar)
+    return max(0, (open_time - pd.Timestamp(current)).total_seconds())
 
 
 #----------------------------------------------------------------------
@@ -81,52 +181,175 @@ def get_day_index(last_day: datetime, hour: int):
 
 
 #----------------------------------------------------------------------
-def run_over_time_frame():
-    """run over all the delivery dates"""
+def calc_holidays(start: datetime.date, end: datetime.date):
+    """calculate the weekdays between start and end which are not open at
+    12:00, the same check as open_at_time does"""
+    schedule_days = cboe_calendar.schedule(start.strftime(DATE_FORMAT),
+                                           end.strftime(DATE_FORMAT))
+    noon = pd.DatetimeIndex(schedule_days.index.strftime(DATE_FORMAT + ' 12:00')).tz_localize(TZ_INFO)
+    is_open = (schedule_days.market_open <= noon) & (noon < schedule_days.market_close)
+    open_days = schedule_days.index[is_open.to_numpy()].strftime(DATE_FORMAT)
+    weekdays = pd.bdate_range(start, end).strftime(DATE_FORMAT)
+    return sorted(set(weekdays) - set(open_days))
+
+
+#----------------------------------------------------------------------
+def third_friday(year: int, month: int):
+    """the 3rd friday of the month, it's between the 15th and the 21st"""
+    day = datetime.date(year, month, 15)
+    return day + datetime.timedelta(days = (4 - day.weekday()) % 7)
+
+
+#----------------------------------------------------------------------
+def next_month(year: int, month: int):
+    """the year and month of the next month"""
+    if 12 == month:
+        return year + 1, 1
+    return year, month + 1
+
+
+#----------------------------------------------------------------------
+def calc_expiration_date(year: int, month: int, calendar: TradingCalendar):
+    """the expiration date of vix futures, 30 days before the next month's
+    3rd friday, the friday moves back to the business day before holidays"""
+    delivery_time = calendar.rollback(third_friday(year, month))
+    return str(delivery_time - np.timedelta64(30, 'D'))
+
+
+#----------------------------------------------------------------------
+def load_calendar(path: str):
+    """load the persisted calendar"""
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+#----------------------------------------------------------------------
+def save_calendar(path: str, calendar: dict):
+    """persist the calendar"""
+    def write(tmp_path: str):
+        with open(tmp_path, 'w') as file:
+            json.dump(calendar, file)
+    atomic_write(path, write)
+
+
+#----------------------------------------------------------------------
+def is_holidays_stale(calendar: dict, today: datetime.date):
+    """check the holidays from a little before today to the end again, once a
+    day, the closures may be added to the source calendar later"""
+    if calendar.get('holidays_checked') == today.strftime(DATE_FORMAT):
+        return False
+    start = today - HOLIDAY_RECHECK_DAYS
+    end = datetime.datetime.strptime(calendar['holidays_end'], DATE_FORMAT).date()
+    if start > end:
+        return True
+    start_key, end_key = start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+    kept = [day for day in calendar['holidays'] if start_key <= day <= end_key]
+    return kept != calc_holidays(start, end)
+
+
+#----------------------------------------------------------------------
+def run_over_time_frame(persist: bool = True):
+    """run over all the delivery dates
+
+    returns the expiration dates and the trading calendar, they are persisted
+    under DATA_ROOT and only extended when the horizon moves to a new month,
+    they are rebuilt if the recent or future holidays changed. nothing is
+    written if not persist"""
+    today = datetime.datetime.now(tz = cboe_calendar.tz).date()
+    end_date = today + CALENDAR_HORIZON
+    # the last month whose 3rd friday is in the horizon
+    end_year, end_month = end_date.year, end_date.month
+    if third_friday(end_year, end_month) > end_date:
+        end_year, end_month = (end_year - 1, 12) if 1 == end_month else (end_year, end_month - 1)
+    end_key = f'{end_year:04d}-{end_month:02d}'
+    path = get_file_path(CALENDAR_FILE)
+    calendar = load_calendar(path)
+    if calendar is not None and calendar.get('end') and \
+       calendar.get('start') == CALENDAR_START.strftime(DATE_FORMAT) and \
+       is_holidays_stale(calendar, today):
+        logger.info("holidays changed, the calendar is rebuilt. ")
+        calendar = None
+    if calendar is None or calendar.get('start') != CALENDAR_START.strftime(DATE_FORMAT):
+        # the first expiration is the one delivered in the 2nd month
+        year, month = next_month(CALENDAR_START.year, CALENDAR_START.month)
+        holiday_start = CALENDAR_START
+        calendar = {'start': CALENDAR_START.strftime(DATE_FORMAT),
+                    'end': None, 'holidays': [], 'expirations': [], 'months': []}
+    elif calendar['end'] < end_key:
+        year, month = next_month(*map(int, calendar['end'].split('-')))
+        holiday_start = datetime.datetime.strptime(calendar['holidays_end'], DATE_FORMAT).date() + ONE_DAY
+    else:
+        trading_calendar = TradingCalendar(calendar['holidays'])
+        # drop the expirations out of the horizon
+        expirations = [date for date, key in
+                       zip(calendar['expirations'], calendar['months'])
+                       if key <= end_key]
+        if persist and calendar.get('holidays_checked') != today.strftime(DATE_FORMAT):
+            calendar['holidays_checked'] = today.strftime(DATE_FORMAT)
+            save_calendar(path, calendar)
+        return expirations, trading_calendar
     logger.info("Calculating contract expiration dates...")
-    futures_exp_dates = []
-    # about 14 months later
-    end_time = datetime.datetime.now(tz = cboe_calendar.tz) + datetime.timedelta(days = 420)
-    cur_time = datetime.datetime(2013, 1, 1, tzinfo = cboe_calendar.tz)
-    schedule_days = cboe_calendar.schedule(cur_time.strftime(DATE_FORMAT),
-                                           end_time.strftime(DATE_FORMAT))
-    while cur_time.weekday() != 4:
-        # find the first friday
-        cur_time += ONE_DAY
-    month_weeks = 0
-    while cur_time < end_time:
-        month_weeks += 1
-        if 3 == month_weeks:
-            # find the month's 3rd friday
-            delivery_time = cur_time
-            while not is_business_day(delivery_time, schedule_days):
-                # make sure it's a business day
-                delivery_time -= ONE_DAY
-            delivery_time -= datetime.timedelta(days = 30)
-            futures_exp_dates.append(delivery_time.strftime(DATE_FORMAT))
-        next_time = cur_time + SEVEN_DAYS
-        if next_time.month != cur_time.month:
-            # new month comes, reset the month_weeks
-            month_weeks = 0
-        cur_time = next_time
-    futures_exp_dates.pop(0)
+    calendar['holidays'].extend(calc_holidays(holiday_start, end_date))
+    trading_calendar = TradingCalendar(calendar['holidays'])
+    while (year, month) <= (end_year, end_month):
+        calendar['expirations'].append(calc_expiration_date(year, month, trading_calendar))
+        calendar['months'].append(f'{year:04d}-{month:02d}')
+        year, month = next_month(year, month)
+    calendar['end'] = end_key
+    calendar['holidays_end'] = end_date.strftime(DATE_FORMAT)
+    calendar['holidays_checked'] = today.strftime(DATE_FORMAT)
+    if persist:
+        make_sure_dirs_exist(DATA_ROOT)
+        save_calendar(path, calendar)
     logger.info("Expiration Dates Generated.")
-    return futures_exp_dates, schedule_days
+    return list(calendar['expirations']), trading_calendar
+
+
+# (day, calendar) of the lookups
+_trading_calendar = None
+_trading_calendar_lock = threading.Lock()
 
 
 #----------------------------------------------------------------------
-def get_recent_trading_days(delta: int = 10, current: datetime = None):
-    """get the last 5 trading days"""
+def get_trading_calendar():
+    """get the trading calendar for the lookups, it's loaded once a day and
+    never persisted here, the daily job persists it"""
+    global _trading_calendar
+    today = datetime.datetime.now(tz = cboe_calendar.tz).date()
+    with _trading_calendar_lock:
+        if _trading_calendar is None or _trading_calendar[0] != today:
+            _trading_calendar = (today, run_over_time_frame(persist = False)[1])
+        return _trading_calendar[1]
+
+
+#----------------------------------------------------------------------
+def get_recent_trading_days(delta: int = 10, current: datetime = None,
+                            calendar: TradingCalendar = None):
+    """get the trading days in the last delta days"""
     if current is None:
         current = datetime.datetime.now(tz = cboe_calendar.tz)
+    if calendar is None:
+        calendar = get_trading_calendar()
     start = current + datetime.timedelta(days = -delta)
-    recent = cboe_calendar.schedule(start_date = start.strftime(DATE_FORMAT),
-                                    end_date = current.strftime(DATE_FORMAT))
-    days = market_cal.date_range(recent, frequency = '1D')
-    days = days.strftime(DATE_FORMAT)
-    # just worked, not good
-    fdays = [is_business_day(x, recent) for x in days]
-    return days[fdays]
+    days = calendar.days_between(start, current)
+    return pd.Index(np.datetime_as_string(days, unit = 'D'))
+
+
+#----------------------------------------------------------------------
+class TradingDayContext():
+    """the recent trading days of one run, it's computed once and shared by
+    all the remote data, it's never changed after created"""
+
+    def __init__(self, calendar: TradingCalendar = None,
+                 current: datetime = None, delta: int = 10):
+        """Constructor"""
+        if calendar is None:
+            calendar = get_trading_calendar()
+        self.calendar = calendar
+        self.recent_days = get_recent_trading_days(delta, current, calendar)
 
 
 #----------------------------------------------------------------------
@@ -141,20 +364,188 @@ def make_sure_dirs_exist(path):
 
 
 #----------------------------------------------------------------------
-def hash_file(filename):
+def fsync_file(path: str):
+    """flush the file to the disk"""
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+#----------------------------------------------------------------------
+def fsync_dir(path: str):
+    """make the renames in the directory durable"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # not supported by the platform
+        pass
+    finally:
+        os.close(fd)
+
+
+#----------------------------------------------------------------------
+def atomic_write(path: str, write: callable):
+    """write the file by write(temp_path) to the temp file, then flush and
+    rename it to path, the file is either the old one or the new one. the
+    temp file is unique, so the concurrent writers never collide"""
+    dir_path = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir = dir_path, prefix = os.path.basename(path) + '.',
+                                    suffix = TEMP_FILE_SUFFIX)
+    os.close(fd)
+    try:
+        # the mode of mkstemp is 0600, keep the one of the target
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = DATA_FILE_MODE
+        os.chmod(tmp_path, mode)
+        write(tmp_path)
+        fsync_file(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(dir_path)
+
+
+#----------------------------------------------------------------------
+def atomic_to_csv(df: pd.DataFrame, path: str, **kwargs):
+    """write the dataframe to the csv file atomically"""
+    atomic_write(path, lambda tmp_path: df.to_csv(path_or_buf = tmp_path, **kwargs))
+
+
+#----------------------------------------------------------------------
+def apply_journal(journal_path: str):
+    """apply the complete journal to its file then remove it, the incomplete
+    one is removed only, the file is not touched before it's complete"""
+    path = journal_path[:-len(JOURNAL_FILE_SUFFIX)]
+    with open(journal_path, 'rb') as file:
+        try:
+            head = json.loads(file.readline())
+            data = file.read()
+            complete = len(data) == head['size'] and \
+                hashlib.sha1(data).hexdigest() == head['sha1']
+        except (ValueError, KeyError, TypeError):
+            complete = False
+    if complete and os.path.exists(path):
+        with open(path, 'r+b') as file:
+            file.seek(head['offset'])
+            file.truncate()
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+    os.remove(journal_path)
+    return complete
+
+
+#----------------------------------------------------------------------
+def journal_write(path: str, offset: int, data: bytes):
+    """replace the file from offset by data in place, the change is written
+    to the journal first, so it's redone if interrupted"""
+    journal_path = path + JOURNAL_FILE_SUFFIX
+    head = {'offset': offset, 'size': len(data), 'sha1': hashlib.sha1(data).hexdigest()}
+    with open(journal_path, 'wb') as file:
+        file.write(json.dumps(head).encode('utf-8') + b'\n')
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    apply_journal(journal_path)
+
+
+#----------------------------------------------------------------------
+def recover_interrupted_writes(root: str = None):
+    """scan the data files under root at startup, the temp files of the
+    interrupted atomic writes are removed, their targets are intact, the
+    journals of the interrupted in place writes are redone"""
+    if root is None:
+        root = DATA_ROOT
+    recovered = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for fn in filenames:
+            fpath = os.path.join(dirpath, fn)
+            if fn.endswith(JOURNAL_FILE_SUFFIX):
+                if apply_journal(fpath):
+                    logger.info(f'interrupted write of {fpath} redone. ')
+                recovered.append(fpath)
+            elif fn.endswith(TEMP_FILE_SUFFIX):
+                os.remove(fpath)
+                logger.info(f'stray temp file {fpath} removed. ')
+                recovered.append(fpath)
+    return recovered
+
+
+#----------------------------------------------------------------------
+def hash_file(filename, buffer_size: int = HASH_BUFFER_SIZE):
     # make a hash object
     hash = hashlib.sha1()
-    with open(filename,'rb') as file:
-        # loop until end of file
-        chunk = 0
-        while chunk != b'':
-            # read only 1024 bytes at a timedelta
-            chunk = file.read(1024)
-            hash.update(chunk)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(filename, 'rb', buffering = 0) as file:
+        # loop until end of file, read into the same buffer
+        size = file.readinto(buffer)
+        while size:
+            hash.update(view[:size])
+            size = file.readinto(buffer)
         # return hex of digest
         return hash.hexdigest()
 
 
+#----------------------------------------------------------------------
+def file_fingerprint(path: str):
+    """the stat fingerprint of the file, (size, mtime_ns, inode)"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+#----------------------------------------------------------------------
+class FingerprintCache():
+    """cache of the values calculated from files, keyed by the fingerprint,
+    the file is read again only if it's changed"""
+
+    def __init__(self):
+        """Constructor"""
+        self._lock = threading.Lock()
+        self._items = {}
+
+    #----------------------------------------------------------------------
+    def get(self, path: str, calc: callable):
+        """get the cached value of the file or calculate it by calc(path)"""
+        key = os.path.abspath(path)
+        fingerprint = file_fingerprint(path)
+        with self._lock:
+            item = self._items.get(key)
+        if item is not None and item[0] == fingerprint:
+            return item[1]
+        value = calc(path)
+        with self._lock:
+            self._items[key] = (fingerprint, value)
+        return value
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """clear the cache"""
+        with self._lock:
+            self._items.clear()
+
+
+# checksum of the files and the checksum of the complete csv files
+checksum_cache = FingerprintCache()
+csv_checksum_cache = FingerprintCache()
+
+
+#----------------------------------------------------------------------
+def cached_hash_file(path: str):
+    """hash the file only if it's changed"""
+    return checksum_cache.get(path, hash_file)
+
+
 #----------------------------------------------------------------------
 def get_file_path(filename: str) -> str:
     return os.path.join(DATA_ROOT, filename)
@@ -163,31 +554,84 @@ def get_file_path(filename: str) -> str:
 #----------------------------------------------------------------------
 def check_file_integrity(path: str, checksum: str):
     """check the local path data """
-    if checksum and hash_file(path) == checksum:
+    if checksum and os.path.exists(path) and cached_hash_file(path) == checksum:
         return True
     return False
 
 
+#----------------------------------------------------------------------
+def read_last_rows(path: str, n: int = 1, block_size: int = 4096):
+    """read the last n data lines of the csv file with their offsets by
+    seeking from the end, the header line is not included"""
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        pos = file.tell()
+        data = b''
+        # one more line for the possible partial line at the block start
+        while pos > 0 and data.count(b'\n') <= n + 1:
+            size = min(block_size, pos)
+            pos -= size
+            file.seek(pos)
+            data = file.read(size) + data
+    rows = []
+    offset = pos
+    for part in data.split(b'\n'):
+        line = part.rstrip(b'\r').decode('utf-8', errors = 'replace')
+        if line.strip():
+            rows.append((offset, line))
+        offset += len(part) + 1
+    if 0 == pos:
+        # drop the header
+        rows = rows[1:]
+    return rows[-n:]
+
+
+#----------------------------------------------------------------------
+def read_last_lines(path: str, n: int = 1, block_size: int = 4096):
+    """read the last n data lines of the csv file by seeking from the end,
+    the header line is not included"""
+    return [line for offset, line in read_last_rows(path, n, block_size)]
+
+
+#----------------------------------------------------------------------
+def read_last_index(path: str):
+    """read the index of the csv file's last row, None if no data"""
+    try:
+        lines = read_last_lines(path)
+    except FileNotFoundError:
+        return None
+    if [] == lines:
+        return None
+    return lines[-1].split(',', 1)[0]
+
+
 #----------------------------------------------------------------------
 def check_data_integrity(path: str, date: str):
     """check data's integrity"""
-    data = pd.read_csv(path)
-    if not data.empty and data[INDEX_KEY].iloc[-1] == date:
-        return True
-    return False
+    return read_last_index(path) == date
+
+
+#----------------------------------------------------------------------
+def csv_checksum(path: str):
+    """the checksum of the csv file if the data is complete, else None"""
+    date, ext = os.path.splitext(os.path.basename(path))
+    if check_data_integrity(path, date):
+        return cached_hash_file(path)
+    return None
 
 
 #----------------------------------------------------------------------
-def generate_csv_checksums(path: str):
-    """generate all csv files' checksums"""
+def generate_csv_checksums(path: str, exclude: set = frozenset()):
+    """generate all csv files' checksums, unchanged files are not read, the
+    files in exclude are skipped"""
     checksums = []
     for root, dirs, filenames in os.walk(path):
         for fn in filenames:
             date, ext = os.path.splitext(fn)
-            if '.csv' == ext:
-                filepath = os.path.join(root, fn)
-                if check_data_integrity(filepath, date):
-                    checksums.append((fn, hash_file(filepath)))
+            if '.csv' == ext and fn not in exclude:
+                checksum = csv_checksum_cache.get(os.path.join(root, fn), csv_checksum)
+                if checksum:
+                    checksums.append((fn, checksum))
     return checksums
 
 
@@ -246,6 +690,26 @@ def mark_by_date(row: pd.Series, sdate: str, edate: str = None):
         return 0
 
 
+#----------------------------------------------------------------------
+def index_to_date_str(index: pd.Index):
+    """convert the index to an array of date str"""
+    if isinstance(index, pd.DatetimeIndex):
+        return np.asarray(index.strftime(DATE_FORMAT), dtype = object)
+    return np.asarray(index, dtype = object)
+
+
+#----------------------------------------------------------------------
+def term_structure_slots(delivery_dates: list, dates: np.ndarray):
+    """map each trade date to its tenor slot, 0 is the nearest one
+
+    delivery_dates must be sorted, a trade date in
+    (delivery_dates[k - 1], delivery_dates[k]] belongs to the slot n - k."""
+    # number of delivery dates strictly before the trade date
+    idxes = np.searchsorted(np.asarray(delivery_dates, dtype = object),
+                            dates, side = 'left')
+    return len(delivery_dates) - idxes
+
+
 #----------------------------------------------------------------------
 def generate_term_structure(delivery_dates: list,
                             futures_info: pd.DataFrame, tdate: str):
@@ -259,18 +723,16 @@ def generate_term_structure(delivery_dates: list,
     sdate = filtered_delivery[0]
     # duplicate the target frame
     term = dup_futures_info(futures_info, sdate, tdate)
-    # generate the term structure according to tdate
-    reversed_delivery = reversed(filtered_delivery)
-    edate = None
-    for idx, sdate in enumerate(reversed_delivery):
-        term.insert(loc = idx, column = idx,
-                    value = term.apply(
-                        lambda x: mark_by_date(x, sdate, edate), axis = 1))
-        # mark the end date for the next item check
-        edate = sdate
-    # drop the settle price column
-    term.drop(columns = [CLOSE_PRICE_NAME, SETTLE_PRICE_NAME], inplace = True)
-    return term
+    size = len(filtered_delivery)
+    slots = term_structure_slots(filtered_delivery,
+                                 index_to_date_str(term.index))
+    # use the settle price, fall back to the close price if not settled
+    settle = term[SETTLE_PRICE_NAME].to_numpy(dtype = float)
+    close = term[CLOSE_PRICE_NAME].to_numpy(dtype = float)
+    prices = np.where(settle != 0, settle, close)
+    values = np.zeros((term.shape[0], size))
+    values[np.arange(term.shape[0]), slots] = prices
+    return pd.DataFrame(values, index = term.index, columns = range(size))
 
 
 #----------------------------------------------------------------------
@@ -282,27 +744,40 @@ def combine_data(futures_info_a: pd.DataFrame, futures_info_b: pd.DataFrame):
 
 
 #----------------------------------------------------------------------
-def combine_all(delivery_dates: list, path: str, max_times: int = 12):
-    """combine the last n futures info, default to the last 12 futures"""
-    paths = sorted(glob.glob(os.path.join(path, '*.csv')), reverse = True)
+def combine_contracts(delivery_dates: list, contracts, max_times: int = 12):
+    """combine the futures info of (delivery date, info) pairs, the pairs are
+    ordered from the later to the front, only the last n ones are loaded"""
     filtered_infos = []
     times = 0
-    for path in paths:
-        res, date = is_futures_file(path)
-        if res:
-            info = load_futures_by_csv(path)
-            term = generate_term_structure(delivery_dates, info, date)
-            if term is None:
-                continue
-            filtered_infos.append(term)
-            times += 1
-            if times >= max_times:
-                break
+    for date, info in contracts:
+        term = generate_term_structure(delivery_dates, info, date)
+        if term is None:
+            continue
+        filtered_infos.append(term)
+        times += 1
+        if times >= max_times:
+            break
     # combine the all infos
     final = reduce(combine_data, filtered_infos)
     return final.fillna(0)
 
 
+#----------------------------------------------------------------------
+def iter_futures_files(path: str):
+    """load the futures files from the later to the front"""
+    paths = sorted(glob.glob(os.path.join(path, '*.csv')), reverse = True)
+    for path in paths:
+        res, date = is_futures_file(path)
+        if res:
+            yield date, load_futures_by_csv(path)
+
+
+#----------------------------------------------------------------------
+def combine_all(delivery_dates: list, path: str, max_times: int = 12):
+    """combine the last n futures info, default to the last 12 futures"""
+    return combine_contracts(delivery_dates, iter_futures_files(path), max_times)
+
+
 #----------------------------------------------------------------------
 def analyze_diff_percent(info: pd.DataFrame):
     """calculate the diff percent"""
@@ -375,6 +850,57 @@ def percent_distribution(vix: pd.Series, val: float = None):
     return ret
 
 
+#----------------------------------------------------------------------
+class RollingPercentile():
+    """streaming version of percent_distribution over a rolling window
+
+    a sorted buffer of the window is kept, so each new value costs a binary
+    search instead of a full sort of the window."""
+
+    def __init__(self, size: int = HV_DISTRIBUTION_PERIODS):
+        """Constructor"""
+        self.size = size
+        self._cuts = index_distribution_of_per(size)
+        self._window = collections.deque()
+        self._sorted = []
+        self._nans = 0
+
+    #----------------------------------------------------------------------
+    def push(self, value: float):
+        """push the next value, return its percentage in the window"""
+        self._window.append(value)
+        if np.isnan(value):
+            self._nans += 1
+        else:
+            bisect.insort(self._sorted, value)
+        if len(self._window) > self.size:
+            old = self._window.popleft()
+            if np.isnan(old):
+                self._nans -= 1
+            else:
+                del self._sorted[bisect.bisect_left(self._sorted, old)]
+        if len(self._window) < self.size or self._nans > 0:
+            # the same as rolling, not enough values in the window
+            return np.nan
+        # count of the cut points below value, the same as percent_distribution
+        count = bisect.bisect_left(self._sorted, value)
+        return bisect.bisect_left(self._cuts, count)
+
+    #----------------------------------------------------------------------
+    def extend(self, values):
+        """push all the values, return the percentages"""
+        return np.array([self.push(val) for val in values], dtype = float)
+
+
+#----------------------------------------------------------------------
+def rolling_percent_distribution(values: pd.Series,
+                                 size: int = HV_DISTRIBUTION_PERIODS):
+    """the same as values.rolling(size).apply(percent_distribution)"""
+    engine = RollingPercentile(size)
+    return pd.Series(engine.extend(values.to_numpy(dtype = float)),
+                     index = values.index, name = values.name)
+
+
 #----------------------------------------------------------------------
 def generate_futures_chain(symbol: str, suffix: str, date: str = None):
     """generate the futures chain of symbol"""
@@ -409,37 +935,52 @@ def format_index(df: pd.DataFrame, delivery_dates: list = []):
 
 #----------------------------------------------------------------------
 def calc_percentage(vx: pd.DataFrame):
-    """calculate the percentage"""
-    historical_max_min_per(vx)
-    vx['per'] = vx.Close.rolling(HV_DISTRIBUTION_PERIODS).apply(lambda rows: percent_distribution(rows))
+    """calculate the percentage, the columns calculated by the resident
+    frame are used directly"""
+    if not {'Max', 'Min', 'mper', 'per'}.issubset(vx.columns):
+        historical_max_min_per(vx)
+        vx['per'] = rolling_percent_distribution(vx.Close)
     vx_51 = vx.iloc[-5:].loc[:, [CLOSE_PRICE_NAME, 'mper', 'per']]
     format_index(vx_51)
     return vx_51, vx.iloc[-1].loc['Max'], vx.iloc[-1].loc['Min']
 
 
 #----------------------------------------------------------------------
-def historical_max_min_per(df: pd.DataFrame):
-    """mark the historical max an min in the dataframe"""
-    # according to:
-    # https://stackoverflow.com/questions/61759149/apply-a-function-on-a-dataframe-that-depend-on-the-previous-row-values
-    # NOTE: I rename the variables with _ to avoid using builtin method names
-    max_ = sys.float_info.min
-    min_ = sys.float_info.max
-    # list for the results
-    l_res = []
-    for value in df.Close.to_numpy():
-        # iterate over the values
-        if value >= max_:
-            max_ = value
-        if value <= min_:
-            min_ = value
-        # append the results in the list
-        ratio = 100
-        if max_ - min_ > 0:
-            ratio = round((value - min_) * 100 / (max_ - min_))
-        l_res.append([max_, min_, ratio])
-    # create the three columns outside of the loop
-    df[['Max', 'Min', 'mper']] = pd.DataFrame(l_res, index = df.index)
+def running_max_min_per(values: np.ndarray,
+                        max_: float = sys.float_info.min,
+                        min_: float = sys.float_info.max):
+    """the running max, min and the percentage of value between them"""
+    # nan never changes the max or min, the same as the comparison does
+    maxes = np.fmax.accumulate(np.concatenate(([max_], values)))[1:]
+    mins = np.fmin.accumulate(np.concatenate(([min_], values)))[1:]
+    span = maxes - mins
+    ratio = np.full(values.shape, 100.0)
+    np.divide((values - mins) * 100, span, out = ratio, where = span > 0)
+    ratio = np.round(ratio)
+    if not np.isnan(ratio).any():
+        ratio = ratio.astype(int)
+    return maxes, mins, ratio
+
+
+#----------------------------------------------------------------------
+def historical_max_min_per(df: pd.DataFrame, start: int = 0):
+    """mark the historical max an min in the dataframe
+
+    rows before start are treated as marked already, the last Max and Min are
+    carried forward so only the rows from start are calculated."""
+    values = df.Close.to_numpy(dtype = float)[start:]
+    if start > 0:
+        maxes, mins, ratio = running_max_min_per(
+            values, df['Max'].iloc[start - 1], df['Min'].iloc[start - 1])
+        index = df.index[start:]
+        df.loc[index, 'Max'] = maxes
+        df.loc[index, 'Min'] = mins
+        df.loc[index, 'mper'] = ratio
+    else:
+        maxes, mins, ratio = running_max_min_per(values)
+        df['Max'] = maxes
+        df['Min'] = mins
+        df['mper'] = ratio
 
 
 #----------------------------------------------------------------------
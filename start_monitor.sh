@@ -38,7 +38,17 @@ case "$mode" in
         fi
         ;;
     stop)
-        kill -9 `cat ./$PID`
+        pid=`cat ./$PID`
+        # the monitor finishes the running job then exits
+        kill $pid
+        for i in `seq 1 60`; do
+            kill -0 $pid 2>/dev/null || break
+            sleep 1
+        done
+        if kill -0 $pid 2>/dev/null; then
+            echo "$SERVICE_NAME is not stopped in 60 seconds, killed. "
+            kill -9 $pid
+        fi
         rm -rf ./$PID
         echo "==== stop $SERVICE_NAME ===="
         ;;
@@ -3,15 +3,17 @@
 import unittest as ut
 import numpy as np
 import pandas as pd
-import os
+import os, shutil, tempfile
 
 from cboe_monitor.utilities import \
-    TEST_DATA_ROOT, \
+    TEST_DATA_ROOT, DATA_ROOT, set_data_root, \
     run_over_time_frame, filter_delivery_dates, shift_delivery_dates, \
     generate_term_structure, load_futures_by_csv, combine_data, \
+    term_structure_slots, combine_contracts, \
     combine_all, is_futures_file, \
     analyze_diff_percent, mk_notification, mk_notification_params
 from cboe_monitor.data_manager import VIXDataManager, GVZDataManager, OVXDataManager
+from cboe_monitor.futures_store import FuturesStore, FrozenManifest
 
 
 def mk_datetime_key(date_str: str):
@@ -20,6 +22,17 @@ def mk_datetime_key(date_str: str):
 
 class TestAnalyze(ut.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        """the calendar is persisted under a temp data root"""
+        cls.data_root = tempfile.mkdtemp()
+        set_data_root(cls.data_root)
+
+    @classmethod
+    def tearDownClass(cls):
+        set_data_root(DATA_ROOT)
+        shutil.rmtree(cls.data_root)
+
     def testDateCompare(self):
         """for date str compare"""
         self.assertEqual(True, '2020-09-10' > '2020-09-09')
@@ -97,6 +110,12 @@ class TestAnalyze(ut.TestCase):
         term5 = generate_term_structure(delivery_dates, futures_0116, '2012-01-16')
         self.assertEqual(None, term5)
 
+    def testTermStructureSlots(self):
+        """for the tenor slot of trade dates"""
+        deliveries = ['2020-07-22', '2020-08-19', '2020-09-16']
+        dates = ['2020-07-23', '2020-08-19', '2020-08-20', '2020-09-16', '2020-09-17']
+        np.testing.assert_array_equal([2, 2, 1, 1, 0],
+                                      term_structure_slots(deliveries, dates))
 
     def testCombineAll(self):
         """"""
@@ -132,6 +151,56 @@ class TestAnalyze(ut.TestCase):
             [np.nan, np.inf, (29.125 - 27.25) / 27.25, -1, np.nan, np.nan,
              np.nan, np.nan, np.nan, np.nan, np.nan, np.nan], delta_p.loc['2020-07-22'])
 
+    def testFuturesStore(self):
+        """the combined term structure from the store is the same"""
+        delivery_dates, calendar = run_over_time_frame()
+        info = combine_all(delivery_dates, TEST_DATA_ROOT)
+        tmp_path = tempfile.mkdtemp()
+        try:
+            for fn in ['2012-01-16.csv', '2013-01-16.csv', '2020-08-19.csv', '2020-09-16.csv']:
+                shutil.copy(os.path.join(TEST_DATA_ROOT, fn), tmp_path)
+            store = FuturesStore(os.path.join(tmp_path, 'futures.npy'))
+            store.compact(tmp_path, '2020-09-01')
+            # the empty and the live contracts are not settled
+            self.assertEqual(['2013-01-16', '2020-08-19'], store.expirations())
+            store = FuturesStore(os.path.join(tmp_path, 'futures.npy'))
+            self.assertEqual(True, store.has('2020-08-19'))
+            self.assertEqual(False, store.has('2020-09-16'))
+            os.remove(os.path.join(tmp_path, '2020-08-19.csv'))
+            sinfo = combine_contracts(delivery_dates, store.iter_contracts(tmp_path))
+            pd.testing.assert_frame_equal(info, sinfo)
+        finally:
+            shutil.rmtree(tmp_path)
+
+    def testFrozenContracts(self):
+        """the frozen contracts are skipped by the download and checksums"""
+        tmp_path = tempfile.mkdtemp()
+        try:
+            for fn in ['2013-01-16.csv', '2020-08-19.csv', '2020-09-16.csv']:
+                shutil.copy(os.path.join(TEST_DATA_ROOT, fn), tmp_path)
+            store = FuturesStore(os.path.join(tmp_path, 'futures.npy'))
+            store.compact(tmp_path, '2020-09-01')
+            frozen = FrozenManifest(os.path.join(tmp_path, 'frozen.json'))
+            self.assertEqual(['2013-01-16', '2020-08-19'], frozen.freeze(store, tmp_path))
+            self.assertEqual([], frozen.freeze(store, tmp_path))
+            frozen = FrozenManifest(os.path.join(tmp_path, 'frozen.json'))
+            self.assertEqual(['2013-01-16', '2020-08-19'], frozen.expirations())
+
+            class TmpDataManager(VIXDataManager):
+                data_path = tmp_path
+                ini_path = os.path.join(tmp_path, 'vix.ini')
+                http_cache_path = os.path.join(tmp_path, 'vix.http.json')
+
+            mgr = TmpDataManager(['2013-01-16', '2020-08-19', '2020-09-16'])
+            rdatas = mgr.prepare_download()
+            self.assertEqual(['VIX', '2020-09-16'], [rdata.local for rdata in rdatas])
+            mgr.finish_download()
+            # the incomplete one is not frozen, the frozen ones are not hashed
+            self.assertEqual(['2013-01-16', '2020-08-19'], mgr.get_frozen_manifest().expirations())
+            self.assertEqual([], mgr.checksums.files())
+        finally:
+            shutil.rmtree(tmp_path)
+
     def testNotificationMsg(self):
         """"""
         delivery_dates, schedule_days = run_over_time_frame()
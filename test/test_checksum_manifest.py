@@ -0,0 +1,58 @@
+# encoding: UTF-8
+
+import unittest as ut
+import os, shutil, tempfile, configparser
+
+from cboe_monitor.utilities import TEST_DATA_ROOT, CHECK_SECTION, hash_file
+from cboe_monitor.checksum_manifest import ChecksumManifest
+
+
+#----------------------------------------------------------------------
+class TestChecksumManifest(ut.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.tmp_path, 'gvz')
+        os.makedirs(self.data_path)
+        self.csv_path = os.path.join(self.data_path, 'GVZ.csv')
+        shutil.copy(os.path.join(TEST_DATA_ROOT, 'GVZ.csv'), self.csv_path)
+        self.path = os.path.join(self.tmp_path, 'gvz.checksums.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def testMigrate(self):
+        """the checksums of the ini are migrated once"""
+        ini_path = os.path.join(self.tmp_path, 'gvz.ini')
+        ini_parser = configparser.ConfigParser()
+        ini_parser.add_section(CHECK_SECTION)
+        ini_parser.set(CHECK_SECTION, 'GVZ.csv', hash_file(self.csv_path))
+        with open(ini_path, 'w') as file:
+            ini_parser.write(file)
+        manifest = ChecksumManifest(self.path, ini_path, self.data_path)
+        self.assertEqual(['GVZ.csv'], manifest.files())
+        self.assertEqual(True, manifest.is_intact(self.csv_path))
+        os.remove(ini_path)
+        manifest = ChecksumManifest(self.path, ini_path, self.data_path)
+        self.assertEqual(hash_file(self.csv_path), manifest.get('GVZ.csv'))
+
+    def testUpdate(self):
+        """the manifest is written only if changed"""
+        manifest = ChecksumManifest(self.path)
+        record = manifest.make_record(self.csv_path, hash_file(self.csv_path), 'GVZ')
+        self.assertEqual(True, manifest.update([record]))
+        self.assertEqual(False, manifest.update([record]))
+        self.assertEqual(False, os.path.exists(self.path + '.tmp'))
+        self.assertEqual(True, manifest.is_intact(self.csv_path))
+        with open(self.csv_path, 'a') as file:
+            file.write('2021-02-01,1,0,1,1,1\n')
+        self.assertEqual(False, manifest.is_intact(self.csv_path))
+        # the torn line is skipped
+        with open(self.path, 'a') as file:
+            file.write('{"file":"OVX.csv","chec')
+        manifest = ChecksumManifest(self.path)
+        self.assertEqual(['GVZ.csv'], manifest.files())
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,68 @@
+# encoding: UTF-8
+
+import unittest as ut
+import threading, time
+from cboe_monitor.download_engine import DownloadEngine
+
+
+#----------------------------------------------------------------------
+class FakeRemoteData():
+    """record the concurrency of sync_data"""
+    lock = threading.Lock()
+    running = {}
+    max_running = {}
+
+    def __init__(self, host: str, delay: float = 0.05):
+        self.host = host
+        self.remote_path = f'https://{host}/'
+        self.delay = delay
+
+    def get_remote_host(self):
+        return self.host
+
+    def sync_data(self):
+        with self.lock:
+            self.running[self.host] = self.running.get(self.host, 0) + 1
+            self.max_running[self.host] = max(self.max_running.get(self.host, 0),
+                                              self.running[self.host])
+        time.sleep(self.delay)
+        with self.lock:
+            self.running[self.host] -= 1
+        return self.host
+
+
+#----------------------------------------------------------------------
+class TestDownloadEngine(ut.TestCase):
+
+    def setUp(self):
+        FakeRemoteData.running = {}
+        FakeRemoteData.max_running = {}
+
+    def testConcurrency(self):
+        """all the data are downloaded in one wave with the limits"""
+        engine = DownloadEngine(concurrency = 6, host_concurrency = 2)
+        rdatas = [FakeRemoteData('a', 0.2) for _ in range(6)] + \
+            [FakeRemoteData('b', 0.2) for _ in range(6)]
+        start = time.time()
+        rets = engine.download(rdatas)
+        self.assertEqual(['a'] * 6 + ['b'] * 6, rets)
+        self.assertEqual({'a': 2, 'b': 2}, FakeRemoteData.max_running)
+        # 4 at the same time, 3 rounds, it's 4 rounds if the global slots
+        # are held by the ones waiting for the same host
+        self.assertLess(time.time() - start, 0.2 * 3.5)
+
+    def testDeadline(self):
+        """the downloads not done before the deadline are cancelled"""
+        engine = DownloadEngine(concurrency = 1, host_concurrency = 1)
+        rdatas = [FakeRemoteData('a', 0.2) for _ in range(5)]
+        start = time.time()
+        rets = engine.download(rdatas, deadline = 0.1)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual([None] * 5, rets)
+        # the running one is done before returned, the others never started
+        self.assertEqual({'a': 0}, FakeRemoteData.running)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+
+if __name__ == '__main__':
+    ut.main()
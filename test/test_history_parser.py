@@ -0,0 +1,95 @@
+# encoding: UTF-8
+
+import unittest as ut
+import json, tracemalloc
+import numpy as np
+import pandas as pd
+
+from cboe_monitor.history_parser import parse_history_json
+
+
+#----------------------------------------------------------------------
+def make_history_payload(years: int = 35):
+    """the synthetic history json of the business days"""
+    dates = pd.bdate_range('1990-01-02', periods = years * 252)
+    rng = np.random.default_rng(0)
+    closes = np.round(rng.uniform(9, 80, dates.size), 2)
+    rows = [{'date': date, 'open': close, 'high': close + 1.5, 'low': close - 1.25,
+             'close': close, 'volume': 0}
+            for date, close in zip(dates.strftime('%Y-%m-%d'), closes.tolist())]
+    return json.dumps({'symbol': '_VIX', 'data': rows}).encode('utf-8')
+
+
+#----------------------------------------------------------------------
+def parse_history_by_dicts(payload: bytes):
+    """the old way, load the whole json then build the frame by the rows"""
+    df = pd.DataFrame(json.loads(payload)['data'])
+    df.set_index('date', inplace = True)
+    df.rename({'open'  : 'Open',
+               'high'  : 'High',
+               'low'   : 'Low',
+               'close' : 'Close',
+               'volume': 'Volume'}, axis = 1, inplace = True)
+    return df
+
+
+#----------------------------------------------------------------------
+def measure_peak(parse: callable, payload: bytes):
+    """the frame and the peak memory of the parse"""
+    tracemalloc.start()
+    df = parse(payload)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, peak
+
+
+#----------------------------------------------------------------------
+class TestHistoryParser(ut.TestCase):
+
+    def testParse(self):
+        """same frame as the rows way"""
+        payload = b'{"symbol": "_VIX", "data": [' \
+            b'{"date": "2021-02-12", "open": 20.5, "high": 21, "low": 19.25, "close": 19.97, "volume": 0},\n' \
+            b'{"date": "2021-02-16", "open": null, "high": 22.1, "low": 20.5, "close": 21.46, "volume": 0}]}'
+        df = parse_history_json(payload)
+        self.assertEqual(['2021-02-12', '2021-02-16'], list(df.index))
+        self.assertEqual(['Open', 'High', 'Low', 'Close', 'Volume'], list(df.columns))
+        self.assertEqual(np.int64, df['Volume'].dtype)
+        self.assertEqual(True, np.isnan(df['Open'].iloc[1]))
+        pd.testing.assert_frame_equal(parse_history_by_dicts(payload), df, check_index_type = False)
+        # empty history
+        self.assertEqual(0, parse_history_json('{"data": []}').shape[0])
+        with self.assertRaises(ValueError):
+            parse_history_json('{"data": [{"date": "2021-02-12"}')
+
+    def testMalformedRows(self):
+        """the malformed rows raise, the missing values are logged"""
+        with self.assertRaises(ValueError):
+            parse_history_json('{"data": [{"date": "2021-02-12", "open": 1, "high": 1, '
+                               '"low": 1, "close": "abc", "volume": 0}]}')
+        with self.assertRaises(ValueError):
+            parse_history_json('{"data": [{"date": "2021-02-12", "open": 1, "high": 1, '
+                               '"low": 1, "close": "19.97", "volume": 0}]}')
+        with self.assertRaises(ValueError):
+            parse_history_json('{"data": [{"date": "2021-02-12", "open": 1, "high": 1, '
+                               '"low": 1, "close": 1, "volume": 0}, {"close": 1}]}')
+        with self.assertRaises(ValueError):
+            parse_history_json('{"data": [{"date": "2021-02-12"}, 1]}')
+        with self.assertLogs('cboe_monitor', level = 'WARNING') as cm:
+            df = parse_history_json('{"data": [{"date": "2021-02-12", "open": 1, "high": 1, '
+                                    '"low": 1, "volume": 0}]}')
+        self.assertIn('2021-02-12', cm.output[0])
+        self.assertIn('close', cm.output[0])
+        self.assertEqual(True, np.isnan(df['Close'].iloc[0]))
+
+    def testLargeHistory(self):
+        """the multi decades history"""
+        payload = make_history_payload()
+        old, old_peak = measure_peak(parse_history_by_dicts, payload)
+        new, new_peak = measure_peak(parse_history_json, payload)
+        pd.testing.assert_frame_equal(old, new, check_index_type = False)
+        self.assertLess(new_peak, old_peak)
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -1,7 +1,7 @@
 # encoding: UTF-8
 
 import unittest as ut
-from cboe_monitor.util_http_bs4 import get_content_json
+from cboe_monitor.util_http_bs4 import get_content_json, get_session
 from cboe_monitor.util_cboe_vix_futures import \
     check_vix_intraday_warning, VixIntradayState, \
     check_warning_info_same, VIX_FUTURES_URL, mk_intraday_notification
@@ -23,6 +23,20 @@ class TestHttpBs4(ut.TestCase):
         self.assertEqual(True, check_warning_info_same(rets, rets2))
         self.assertEqual({}, v1)
 
+    def testSessionPoolEnlarged(self):
+        """the old pool is closed when the pool is enlarged"""
+        session = get_session()
+        old = session.get_adapter('https://')
+        size = old._pool_maxsize
+        closed = []
+        old.close = lambda: closed.append(old)
+        self.assertIs(session, get_session(size + 1))
+        self.assertEqual([old], closed)
+        self.assertIsNot(old, session.get_adapter('https://'))
+        self.assertIs(session.get_adapter('http://'), session.get_adapter('https://'))
+        # no smaller pool
+        self.assertIs(session.get_adapter('https://'), get_session(size).get_adapter('https://'))
+
 
 if __name__ == '__main__':
     ut.main()
@@ -0,0 +1,70 @@
+# encoding: UTF-8
+
+import unittest as ut
+import pandas as pd
+import os, shutil, tempfile
+
+from cboe_monitor.utilities import TEST_DATA_ROOT, load_vix_by_csv
+from cboe_monitor.incremental_csv import IncrementalCsvWriter
+
+
+#----------------------------------------------------------------------
+class TestIncrementalCsv(ut.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_path, 'GVZ.csv')
+        self.gvz = load_vix_by_csv(os.path.join(TEST_DATA_ROOT, 'GVZ.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def merged(self, ldf: pd.DataFrame, data: pd.DataFrame):
+        """the result of merging the whole file"""
+        data = pd.concat([ldf, data])
+        return data[~data.index.duplicated(keep = 'last')]
+
+    def testUpdate(self):
+        """the revised and new rows are written"""
+        writer = IncrementalCsvWriter(self.path, tail_rows = 8)
+        ldf = self.gvz.iloc[:-2]
+        writer.write_all(ldf)
+        with open(self.path, 'rb') as file:
+            head = file.read(os.path.getsize(self.path) - 200)
+        # the last row is revised and 2 rows are new
+        data = self.gvz.iloc[-3:].copy()
+        data.iloc[0, 0] += 1
+        self.assertEqual(True, writer.update(data))
+        pd.testing.assert_frame_equal(self.merged(ldf, data), load_vix_by_csv(self.path))
+        # the rows before the revised one are not touched
+        with open(self.path, 'rb') as file:
+            self.assertEqual(head, file.read(len(head)))
+        # nothing changed
+        self.assertEqual(False, writer.update(data))
+        size = os.path.getsize(self.path)
+        self.assertEqual(False, writer.update(data.iloc[0:0]))
+        self.assertEqual(size, os.path.getsize(self.path))
+        # the index is rebuilt if the file is changed by others
+        os.remove(writer.index_path)
+        ldf = load_vix_by_csv(self.path)
+        data = self.gvz.iloc[-1:] * 2
+        self.assertEqual(True, writer.update(data))
+        pd.testing.assert_frame_equal(self.merged(ldf, data), load_vix_by_csv(self.path))
+
+    def testMergeAll(self):
+        """the rows out of the index or the changed columns merge the file"""
+        writer = IncrementalCsvWriter(self.path, tail_rows = 8)
+        ldf = self.gvz.iloc[:-2]
+        writer.write_all(ldf)
+        data = self.gvz.iloc[-20:].copy()
+        data.iloc[0, 0] += 1
+        self.assertEqual(True, writer.update(data))
+        pd.testing.assert_frame_equal(self.merged(ldf, data), load_vix_by_csv(self.path))
+        ldf = load_vix_by_csv(self.path)
+        data = self.gvz.iloc[-1:][['Open', 'High', 'Low', 'Close', 'Volume']]
+        self.assertEqual(True, writer.update(data))
+        pd.testing.assert_frame_equal(self.merged(ldf, data), load_vix_by_csv(self.path))
+
+
+if __name__ == '__main__':
+    ut.main()
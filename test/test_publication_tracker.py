@@ -0,0 +1,227 @@
+# encoding: UTF-8
+
+import unittest as ut
+import os, shutil, tempfile, threading, functools, time
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from cboe_monitor.utilities import DATA_ROOT, set_data_root
+from cboe_monitor.schedule_manager import CRONTAB_DOIT_MIN_DELAY
+from cboe_monitor.util_http_bs4 import HttpValidatorCache, probe_modified
+from cboe_monitor.publication_tracker import PublicationHistory, PublicationScheduleManager, \
+    PUBLICATION_HISTORY_SIZE, PROBE_LEAD, PROBE_MIN_DELAY, PROBE_MAX_DELAY, \
+    PROBE_BACKOFF_WINDOW, get_first_probe_offset, next_probe_delay
+
+
+#----------------------------------------------------------------------
+class ValidatorHandler(SimpleHTTPRequestHandler):
+    """Last-Modified is sent only if validators is True"""
+    validators = True
+
+    def send_header(self, keyword, value):
+        if self.validators or 'Last-Modified' != keyword:
+            super(ValidatorHandler, self).send_header(keyword, value)
+
+    def log_message(self, format, *args):
+        pass
+
+
+#----------------------------------------------------------------------
+class FakeScheduleManager(PublicationScheduleManager):
+    """the fire is set by the test, the results of the attempts are given"""
+    _crontab = '50 21 * * *'
+    _stage_names = ('vix', 'gvz')
+    fire = None
+    results = []
+    attempts = 0
+
+    def get_scheduled_fire(self):
+        if self.fire is None:
+            return super(FakeScheduleManager, self).get_scheduled_fire()
+        return self.fire
+
+    def get_pending_stages(self):
+        return list(self._stage_names)
+
+    def do_attempt(self):
+        self.attempts += 1
+        return self.results.pop(0)
+
+
+#----------------------------------------------------------------------
+class TestPublicationTracker(ut.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_path, 'publication.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def testHistory(self):
+        """the recent offsets are kept and the median is expected"""
+        history = PublicationHistory(self.path)
+        self.assertEqual(None, history.expected_offset(['vix']))
+        for idx in range(PUBLICATION_HISTORY_SIZE + 5):
+            self.assertEqual(True, history.record('vix', f'2021-01-{idx + 1:02d}', idx * 10))
+        # the first publication of the day is kept, the abnormal ones are ignored
+        self.assertEqual(False, history.record('vix', '2021-01-25', 5))
+        self.assertEqual(False, history.record('vix', '2021-01-01', 5))
+        self.assertEqual(False, history.record('gvz', '2021-01-01', -1))
+        self.assertEqual(True, history.record('gvz', '2021-01-01', 900))
+        history = PublicationHistory(self.path)
+        offsets = history.get_offsets('vix')
+        self.assertEqual(PUBLICATION_HISTORY_SIZE, len(offsets))
+        self.assertEqual(50, offsets[0])
+        self.assertEqual(150, history.expected_offset(['vix']))
+        self.assertEqual(900, history.expected_offset(['vix', 'gvz']))
+        self.assertEqual(None, history.expected_offset(['vix', 'ovx']))
+
+    def testProbeDelay(self):
+        """wait until the expected publication, probe tightly then back off"""
+        self.assertEqual(0, get_first_probe_offset(None))
+        self.assertEqual(600 - PROBE_LEAD, get_first_probe_offset(600))
+        delay = next_probe_delay(0, 600)
+        self.assertTrue(600 - PROBE_LEAD - PROBE_MIN_DELAY <= delay <= 600 - PROBE_LEAD)
+        for elapsed in [600 - PROBE_LEAD, 600, 600 + PROBE_BACKOFF_WINDOW - 1]:
+            delay = next_probe_delay(elapsed, 600)
+            self.assertTrue(PROBE_MIN_DELAY / 2 <= delay <= PROBE_MIN_DELAY)
+        delay = next_probe_delay(600 + PROBE_BACKOFF_WINDOW, 600)
+        self.assertTrue(PROBE_MIN_DELAY < delay <= 2 * PROBE_MIN_DELAY)
+        self.assertTrue(next_probe_delay(3600 * 5, None) <= PROBE_MAX_DELAY)
+
+
+#----------------------------------------------------------------------
+class TestPublicationSchedule(ut.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """the history is kept under a temp data root"""
+        cls.data_root = tempfile.mkdtemp()
+        set_data_root(cls.data_root)
+        cls.mgr = FakeScheduleManager()
+        cls.mgr.cancel_timer()
+
+    @classmethod
+    def tearDownClass(cls):
+        set_data_root(DATA_ROOT)
+        shutil.rmtree(cls.data_root)
+
+    def setUp(self):
+        self.mgr._history = PublicationHistory(os.path.join(self.data_root, 'publication.jsonl'))
+        self.mgr._done_fire = None
+        self.mgr.reset_probes()
+        self.mgr.fire = None
+        self.mgr.results = []
+        self.mgr.attempts = 0
+
+    def tearDown(self):
+        path = os.path.join(self.data_root, 'publication.jsonl')
+        if os.path.exists(path):
+            os.remove(path)
+
+    def record(self, offsets: dict):
+        """the history of the stages"""
+        for name, offset in offsets.items():
+            self.assertEqual(True, self.mgr._history.record(name, '2021-01-04', offset))
+
+    def testShiftedFirstAttempt(self):
+        """the first attempt is a little before the expected publication"""
+        self.mgr.fire = time.time() - 10
+        delay = self.mgr.get_delay_time()
+        self.assertTrue(0 < delay <= 24 * 3600)
+        self.record({'vix': 600, 'gvz': 300})
+        # the latest stage is waited for
+        self.assertAlmostEqual(600 - PROBE_LEAD - 10, self.mgr.get_delay_time(), delta = 1)
+        # the due one is shifted on the next fire
+        self.mgr.fire = time.time() - (600 - PROBE_LEAD)
+        self.assertTrue(600 - PROBE_LEAD < self.mgr.get_delay_time())
+
+    def testMinDelaySuppressesRun(self):
+        """the attempt isn't done if it's fired a little early"""
+        self.record({'vix': 600, 'gvz': 600})
+        self.mgr.fire = time.time() - (600 - PROBE_LEAD) + CRONTAB_DOIT_MIN_DELAY / 2
+        self.mgr.results = [True]
+        delay = self.mgr.timeout(True)
+        self.assertEqual(0, self.mgr.attempts)
+        self.assertTrue(0 < delay <= CRONTAB_DOIT_MIN_DELAY)
+        self.assertEqual(None, self.mgr._done_fire)
+
+    def testRetryThenSuccess(self):
+        """the failed attempt is retried by the probe delay, the fire is done
+        once it succeeds"""
+        self.record({'vix': 600, 'gvz': 600})
+        fire = time.time() - 10
+        self.mgr.fire = fire
+        self.mgr.results = [False, True]
+        delay = self.mgr.timeout(True)
+        self.assertEqual(1, self.mgr.attempts)
+        self.assertTrue(delay <= 600 - PROBE_LEAD - 10)
+        self.assertEqual(None, self.mgr._done_fire)
+        delay = self.mgr.timeout(True)
+        self.assertEqual(2, self.mgr.attempts)
+        self.assertEqual(fire, self.mgr._done_fire)
+        # the shifted attempt of the done fire is not scheduled again
+        self.assertTrue(600 - PROBE_LEAD < delay)
+        self.assertTrue(600 - PROBE_LEAD < self.mgr.get_delay_time())
+
+    def testRecordPublication(self):
+        """the probe which found the stage published is recorded, the ones
+        published at their first attempt are not"""
+        self.record({'vix': 600, 'gvz': 600})
+        self.mgr.fire = time.time() - (600 - PROBE_LEAD)
+        self.assertEqual(True, self.mgr.probe_urls([]))
+        self.mgr.record_publication(['vix', 'gvz'], '2021-01-05')
+        self.assertEqual([600], self.mgr._history.get_offsets('vix'))
+        self.assertEqual(600, self.mgr._history.expected_offset(['vix', 'gvz']))
+        # found later by the retry, the runtime of the attempt is excluded
+        self.mgr.mark_unpublished(['vix'])
+        self.mgr.fire = time.time() - 700
+        self.mgr.probe_urls([])
+        time.sleep(0.5)
+        self.mgr.record_publication(['vix', 'gvz'], '2021-01-06')
+        offsets = self.mgr._history.get_offsets('vix')
+        self.assertEqual(2, len(offsets))
+        self.assertAlmostEqual(700, offsets[-1], delta = 0.2)
+        self.assertEqual([600], self.mgr._history.get_offsets('gvz'))
+
+    def testProbe(self):
+        """the probes with and without the validators"""
+        root = tempfile.mkdtemp()
+        path = os.path.join(root, 'VIX_History.csv')
+        with open(path, 'w') as file:
+            file.write('DATE,OPEN,HIGH,LOW,CLOSE\n')
+        handler = functools.partial(ValidatorHandler, directory = root)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target = server.serve_forever, daemon = True)
+        thread.start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/VIX_History.csv'
+        try:
+            cache = HttpValidatorCache()
+            self.assertEqual(True, probe_modified(url, cache))
+            self.assertIn('If-Modified-Since', cache.get_headers(url))
+            self.assertEqual(False, probe_modified(url, cache))
+            mtime = os.path.getmtime(path) + 10
+            os.utime(path, (mtime, mtime))
+            self.assertEqual(True, probe_modified(url, cache))
+            self.assertEqual(False, probe_modified(url, cache))
+            # the first attempt and the stale one are forced
+            self.mgr._probe_cache = cache
+            self.assertEqual(True, self.mgr.probe_urls([url]))
+            self.mgr.start_attempt()
+            self.assertEqual(False, self.mgr.probe_urls([url]))
+            # it can't be told without the validators
+            ValidatorHandler.validators = False
+            cache = HttpValidatorCache()
+            self.assertEqual(True, probe_modified(url, cache))
+            self.assertEqual({}, cache.get_headers(url))
+            self.assertEqual(True, probe_modified(url, cache))
+            self.assertEqual(True, probe_modified(url + '.none', cache))
+        finally:
+            ValidatorHandler.validators = True
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    ut.main()
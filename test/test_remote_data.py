@@ -2,8 +2,25 @@
 
 import unittest as ut
 import pandas as pd
-from cboe_monitor.utilities import load_vix_by_csv
+import os, shutil, tempfile, threading, functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from cboe_monitor.utilities import load_vix_by_csv, TEST_DATA_ROOT, hash_file
+from cboe_monitor.checksum_manifest import ChecksumManifest
 from cboe_monitor.remote_data import RemoteDataFactory, SYNC_DATA_MODE
+from cboe_monitor.util_http_bs4 import HttpValidatorCache
+
+
+#----------------------------------------------------------------------
+class RecordHandler(SimpleHTTPRequestHandler):
+    """record the status of the requests"""
+    statuses = []
+
+    def send_response(self, code, message = None):
+        self.statuses.append(code)
+        super(RecordHandler, self).send_response(code, message)
+
+    def log_message(self, format, *args):
+        pass
 
 
 class TestRemoteData(ut.TestCase):
@@ -67,5 +84,70 @@ class TestRemoteData(ut.TestCase):
         self.assertEqual((old_size, 6), nf.shape)
 
 
+#----------------------------------------------------------------------
+class TestConditionalDownload(ut.TestCase):
+
+    def setUp(self):
+        """serve the test data by a local http server"""
+        RecordHandler.statuses = []
+        handler = functools.partial(RecordHandler, directory = TEST_DATA_ROOT)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_path)
+
+    def testNotModified(self):
+        """the unchanged live contract is a 304 hit"""
+        cache = HttpValidatorCache(os.path.join(self.tmp_path, 'http.json'))
+        data_fac = RemoteDataFactory(self.tmp_path, None, cache)
+        rdata = data_fac.create('2020-09-16', self.url + '2020-09-16.csv',
+                                SYNC_DATA_MODE.HTTP_DOWNLOAD_FILE)
+        self.assertEqual((191, 11), rdata.sync_data().shape)
+        self.assertEqual(None, rdata.sync_data())
+        self.assertEqual([200, 304], RecordHandler.statuses)
+        self.assertEqual(False, cache.is_immutable(rdata.remote_path))
+        # the validators are saved
+        cache.save()
+        cache = HttpValidatorCache(os.path.join(self.tmp_path, 'http.json'))
+        self.assertNotEqual({}, cache.get_headers(rdata.remote_path))
+
+    def testImmutable(self):
+        """the expired contract is never requested again"""
+        cache = HttpValidatorCache()
+        data_fac = RemoteDataFactory(self.tmp_path, None, cache)
+        rdata = data_fac.create('2020-08-19', self.url + '2020-08-19.csv',
+                                SYNC_DATA_MODE.HTTP_DOWNLOAD_FILE)
+        rdata.sync_data()
+        self.assertEqual(True, cache.is_immutable(rdata.remote_path))
+        rdata.sync_data()
+        self.assertEqual([200], RecordHandler.statuses)
+
+    def testBrokenRepaired(self):
+        """the broken file is downloaded again unconditionally, even if it's
+        immutable"""
+        cache = HttpValidatorCache()
+        checksums = ChecksumManifest(os.path.join(self.tmp_path, 'checksums.jsonl'))
+        data_fac = RemoteDataFactory(self.tmp_path, checksums, cache)
+        rdata = data_fac.create('2020-08-19', self.url + '2020-08-19.csv',
+                                SYNC_DATA_MODE.HTTP_DOWNLOAD_FILE)
+        rdata.sync_data()
+        path = rdata.get_local_path()
+        checksum = hash_file(path)
+        checksums.update([checksums.make_record(path, checksum)])
+        self.assertEqual(True, cache.is_immutable(rdata.remote_path))
+        # the intact one is not requested
+        self.assertEqual(None, rdata.sync_data())
+        with open(path, 'a') as file:
+            file.write('broken')
+        self.assertEqual((185, 11), rdata.sync_data().shape)
+        self.assertEqual([200, 200], RecordHandler.statuses)
+        self.assertEqual(checksum, hash_file(path))
+
+
 if __name__ == '__main__':
     ut.main()
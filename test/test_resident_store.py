@@ -0,0 +1,53 @@
+# encoding: UTF-8
+
+import unittest as ut
+import pandas as pd
+import os, shutil, tempfile
+
+from cboe_monitor.utilities import TEST_DATA_ROOT, load_vix_by_csv
+from cboe_monitor.resident_store import ResidentFrame
+
+
+#----------------------------------------------------------------------
+class TestResidentStore(ut.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_path, 'GVZ.csv')
+        self.gvz = load_vix_by_csv(os.path.join(TEST_DATA_ROOT, 'GVZ.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def assertSameAsFull(self, frame: ResidentFrame):
+        """the resident frame is the same as the one calculated by all rows"""
+        pd.testing.assert_frame_equal(ResidentFrame(self.path).load(), frame.load())
+
+    def testApply(self):
+        """the new and revised rows are applied"""
+        self.gvz.iloc[:-5].to_csv(self.path)
+        frame = ResidentFrame(self.path)
+        frame.load()
+        # the last row is revised and a new row
+        data = self.gvz.iloc[:-3].copy()
+        data.iloc[-2, 0] += 1
+        data.to_csv(self.path)
+        self.assertSameAsFull(frame)
+        # the rows are appended
+        with open(self.path, 'a') as file:
+            file.write(self.gvz.iloc[-3:].to_csv(header = False))
+        self.assertSameAsFull(frame)
+        # the row without close is dropped
+        with open(self.path, 'a') as file:
+            file.write('2021-02-01,,,,,\n')
+        self.assertSameAsFull(frame)
+        self.assertEqual(self.gvz.index[-1], frame.load().index[-1])
+        # the front rows are changed
+        data = pd.read_csv(self.path, index_col = 0)
+        data.iloc[0, 0] += 1
+        data.to_csv(self.path)
+        self.assertSameAsFull(frame)
+
+
+if __name__ == '__main__':
+    ut.main()
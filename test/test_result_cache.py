@@ -0,0 +1,95 @@
+# encoding: UTF-8
+
+import unittest as ut
+import os, shutil, tempfile
+import pandas as pd
+
+from cboe_monitor.utilities import TEST_DATA_ROOT
+from cboe_monitor.result_cache import ResultCache, analysis_cache
+from cboe_monitor.data_manager import GVZDataManager
+
+
+#----------------------------------------------------------------------
+class TestResultCache(ut.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def testLRU(self):
+        """the least recently used result is evicted"""
+        cache = ResultCache(capacity = 2)
+        calls = []
+
+        def calc(value):
+            def func():
+                calls.append(value)
+                return value
+            return func
+
+        self.assertEqual(1, cache.get(('a', ), calc(1)))
+        self.assertEqual(2, cache.get(('b', ), calc(2)))
+        self.assertEqual(1, cache.get(('a', ), calc(-1)))
+        # b is evicted
+        self.assertEqual(3, cache.get(('c', ), calc(3)))
+        self.assertEqual(1, cache.get(('a', ), calc(-1)))
+        self.assertEqual(-2, cache.get(('b', ), calc(-2)))
+        self.assertEqual([1, 2, 3, -2], calls)
+
+    def testAnalyze(self):
+        """the analysis runs again only if the local files changed"""
+        data_path = os.path.join(self.tmp_path, 'gvz')
+        os.makedirs(data_path)
+        shutil.copy(os.path.join(TEST_DATA_ROOT, 'GVZ.csv'), data_path)
+        calls = []
+
+        class TmpDataManager(GVZDataManager):
+            ini_path = os.path.join(self.tmp_path, 'gvz.ini')
+
+            def do_analyze(self):
+                calls.append(1)
+                return super(TmpDataManager, self).do_analyze()
+
+        TmpDataManager.data_path = data_path
+        analysis_cache.clear()
+        rets = TmpDataManager().analyze()
+        # the copy is changed only
+        rets['gvz']['changed'] = 0
+        rets = TmpDataManager().analyze()
+        self.assertEqual(1, len(calls))
+        self.assertEqual(False, 'changed' in rets['gvz'].columns)
+        with open(os.path.join(data_path, 'GVZ.csv'), 'a') as file:
+            file.write('2021-02-17,20,21,19,20,0\n')
+        rets = TmpDataManager().analyze()
+        self.assertEqual(2, len(calls))
+        self.assertEqual('2021-02-17', rets['gvz'].index[-1])
+
+    def testCombineAll(self):
+        """the cached term structure is not changed by the callers"""
+        data_path = os.path.join(self.tmp_path, 'vix')
+        os.makedirs(data_path)
+        calls = []
+
+        class TmpDataManager(GVZDataManager):
+            ini_path = os.path.join(self.tmp_path, 'vix.ini')
+
+            def do_combine_all(self, max_times: int = 12):
+                calls.append(1)
+                return pd.DataFrame({0: [20.0, 21.0], 1: [22.0, 23.0]},
+                                    index = ['2021-02-11', '2021-02-12'])
+
+        TmpDataManager.data_path = data_path
+        analysis_cache.clear()
+        term = TmpDataManager().combine_all()
+        term['changed'] = 0
+        term.iloc[0, 0] = -1
+        term = TmpDataManager().combine_all()
+        self.assertEqual(1, len(calls))
+        self.assertEqual(False, 'changed' in term.columns)
+        self.assertEqual(20.0, term.iloc[0, 0])
+
+
+if __name__ == '__main__':
+    ut.main()
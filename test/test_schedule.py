@@ -1,8 +1,9 @@
 # encoding: UTF-8
 
 import unittest as ut
+import threading
 from time import sleep
-from cboe_monitor.schedule_manager import ScheduleManager
+from cboe_monitor.schedule_manager import ScheduleManager, Scheduler, get_crontab
 from cboe_monitor.logger import logger
 
 
@@ -24,6 +25,45 @@ class TestSchedule(ut.TestCase):
         mgr2 = TestScheduleManager()
         self.assertEqual(mgr1, mgr2)
 
+    def testCrontabCached(self):
+        """"""
+        self.assertIs(get_crontab('28 * * * *'), get_crontab('28 * * * *'))
+
+    def testScheduler(self):
+        """the due jobs run by the priority in one thread"""
+        scheduler = Scheduler()
+        fired = []
+        done = threading.Event()
+
+        class Job():
+            def __init__(self, name: str, delay: float):
+                self.name = name
+                self.delay = delay
+
+            def timeout(self, doit: bool = True):
+                fired.append((self.name, threading.current_thread().name))
+                if 'block' == self.name:
+                    sleep(0.1)
+                if len(fired) >= 5:
+                    done.set()
+                return self.delay
+
+        low, high, removed = Job('low', 0.05), Job('high', 0.05), Job('removed', 0)
+        # the jobs are due at the same time after the blocking one
+        scheduler.add(Job('block', 60), 0)
+        sleep(0.02)
+        scheduler.add(low, 0, priority = 2)
+        scheduler.add(high, 0, priority = 1)
+        scheduler.add(removed, 0.01)
+        scheduler.remove(removed)
+        self.assertEqual(True, done.wait(2))
+        scheduler.stop()
+        scheduler.join(2)
+        self.assertEqual(False, scheduler.is_running())
+        self.assertEqual([('block', 'Scheduler'), ('high', 'Scheduler'), ('low', 'Scheduler')],
+                         fired[:3])
+        self.assertEqual(False, 'removed' in [name for name, _ in fired])
+
     def notestSchedule(self):
         """"""
         mgr = TestScheduleManager()
@@ -0,0 +1,61 @@
+# encoding: UTF-8
+
+import unittest as ut
+import os, shutil, tempfile
+import numpy as np
+
+from cboe_monitor.snapshot_ring import SnapshotRing, snapshot_to_items, NO_VOLUME
+
+
+#----------------------------------------------------------------------
+def mk_items(last: float):
+    """the quote items of the payload"""
+    return [{'symbol': 'VX/G1', 'last_price': str(last), 'high': '21', 'low': '19',
+             'volume': '1000', 'prev_settlement': '20'},
+            {'symbol': 'VX/H1', 'last_price': '-', 'high': '-', 'low': '-',
+             'volume': '-', 'prev_settlement': '22'}]
+
+
+#----------------------------------------------------------------------
+class TestSnapshotRing(ut.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_path, 'intraday.npy')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def testRing(self):
+        """the oldest rows are overwritten and the ring survives the reload"""
+        ring = SnapshotRing(self.path, capacity = 5)
+        self.assertEqual(0, ring.last_snapshot().size)
+        for idx in range(3):
+            ring.append(1600000000 + idx * 60, mk_items(20 + idx))
+        self.assertEqual(5, len(ring))
+        views = ring.views()
+        # the views of the memory map, nothing is copied
+        for view in views:
+            self.assertEqual(True, np.shares_memory(view, ring._data))
+        rows = np.concatenate(views)
+        self.assertEqual([21, 22], rows['last'][[1, 3]].tolist())
+        self.assertEqual(list(range(2, 7)), rows['seq'].tolist())
+        ring.close()
+        ring = SnapshotRing(self.path, capacity = 100)
+        self.assertEqual(5, ring.capacity)
+        last = ring.last_snapshot()
+        self.assertEqual(['VX/G1', 'VX/H1'], last['symbol'].tolist())
+        self.assertEqual(np.datetime64(1600000120, 's'), last['timestamp'][0])
+        items = snapshot_to_items(last)
+        self.assertEqual(22, items[0]['last_price'])
+        self.assertEqual('-', items[1]['volume'])
+        self.assertEqual(NO_VOLUME, last['volume'][1])
+        self.assertEqual(True, np.isnan(last['high'][1]))
+        ring.append(1600000180, mk_items(23))
+        rows = np.concatenate(ring.views())
+        self.assertEqual(list(range(4, 9)), rows['seq'].tolist())
+        self.assertEqual(23, ring.last_snapshot()['last'][0])
+
+
+if __name__ == '__main__':
+    ut.main()
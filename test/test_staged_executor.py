@@ -0,0 +1,43 @@
+# encoding: UTF-8
+
+import unittest as ut
+import time
+from cboe_monitor.staged_executor import StagedExecutor
+
+
+#----------------------------------------------------------------------
+class TestStagedExecutor(ut.TestCase):
+
+    def testRetry(self):
+        """the done stages are not run again"""
+        calls = {'a': 0, 'b': 0, 'c': 0}
+
+        def stage(name: str, ok: bool):
+            def func():
+                calls[name] += 1
+                time.sleep(0.1)
+                if not ok:
+                    raise ValueError(name)
+                return name
+            return func
+
+        executor = StagedExecutor()
+        start = time.time()
+        self.assertEqual(False, executor.run({'a': stage('a', True),
+                                              'b': stage('b', False),
+                                              'c': lambda: None}))
+        # at the same time
+        self.assertLess(time.time() - start, 0.2)
+        self.assertEqual('a', executor.get('a'))
+        self.assertEqual(False, executor.is_done('b'))
+        self.assertEqual(True, executor.run({'a': stage('a', True),
+                                             'b': stage('b', True),
+                                             'c': stage('c', True)}))
+        self.assertEqual({'a': 1, 'b': 2, 'c': 1}, calls)
+        self.assertEqual('b', executor.get('b'))
+        executor.clear()
+        self.assertEqual(None, executor.get('a'))
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -1,22 +1,41 @@
 # encoding: UTF-8
 
 import unittest as ut
-import os
+import os, tempfile, shutil, hashlib, threading, stat
 
 from cboe_monitor.utilities import \
-    TEST_DATA_ROOT, DATE_FORMAT, get_day_index, \
+    TEST_DATA_ROOT, DATA_ROOT, DATE_FORMAT, get_day_index, set_data_root, \
     run_over_time_frame, get_file_path, \
     check_data_integrity, generate_csv_checksums, generate_futures_chain, \
-    index_distribution_of_per, get_recent_trading_days
+    index_distribution_of_per, get_recent_trading_days, \
+    load_vix_by_csv, percent_distribution, rolling_percent_distribution, \
+    HV_DISTRIBUTION_PERIODS, historical_max_min_per, \
+    third_friday, calc_expiration_date, is_business_day, TradingCalendar, \
+    FingerprintCache, hash_file, read_last_lines, read_last_index, \
+    TradingDayContext, get_trading_calendar, CALENDAR_FILE, \
+    atomic_write, atomic_to_csv, journal_write, recover_interrupted_writes, \
+    get_cfe_session, get_cfe_closed_delay, calc_holidays, is_holidays_stale
 
 import pandas_datareader as pdr
 import pandas as pd
-from datetime import datetime
+import numpy as np
+from datetime import datetime, timezone
 
 
 #----------------------------------------------------------------------
 class TestUnititiesCase(ut.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        """the calendar is persisted under a temp data root"""
+        cls.data_root = tempfile.mkdtemp()
+        set_data_root(cls.data_root)
+
+    @classmethod
+    def tearDownClass(cls):
+        set_data_root(DATA_ROOT)
+        shutil.rmtree(cls.data_root)
+
     #----------------------------------------------------------------------
     def testDayIndex(self):
         """test for get_day_index"""
@@ -37,6 +56,80 @@ class TestUnititiesCase(ut.TestCase):
         filepath = os.path.join(TEST_DATA_ROOT, '2012-01-16.csv')
         self.assertEqual(False, check_data_integrity(filepath, '2012-01-16'))
 
+    #----------------------------------------------------------------------
+    def testReadLastLines(self):
+        """test for reading the tail of csv"""
+        filepath = os.path.join(TEST_DATA_ROOT, 'GVZ.csv')
+        tail = pd.read_csv(filepath).tail(3)
+        lines = read_last_lines(filepath, 3, block_size = 64)
+        self.assertEqual(tail['Trade Date'].tolist(), [line.split(',')[0] for line in lines])
+        self.assertEqual('2021-01-29', read_last_index(filepath))
+        filepath = os.path.join(TEST_DATA_ROOT, '2013-01-16.csv')
+        self.assertEqual(11, len(read_last_lines(filepath, 20, block_size = 16)))
+        # only the header or no file
+        self.assertEqual(None, read_last_index(os.path.join(TEST_DATA_ROOT, '2012-01-16.csv')))
+        self.assertEqual(None, read_last_index(os.path.join(TEST_DATA_ROOT, 'none.csv')))
+
+    #----------------------------------------------------------------------
+    def testAtomicWrites(self):
+        """the interrupted writes are recovered"""
+        tmp_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_path, 'GVZ.csv')
+            gvz = load_vix_by_csv(os.path.join(TEST_DATA_ROOT, 'GVZ.csv'))
+            atomic_to_csv(gvz, path)
+            self.assertEqual(['GVZ.csv'], os.listdir(tmp_path))
+            pd.testing.assert_frame_equal(gvz, load_vix_by_csv(path))
+            journal_write(path, os.path.getsize(path), b'2021-02-01,1,0,1,1,1\n')
+            self.assertEqual('2021-02-01', read_last_index(path))
+            # the stray temp file is removed
+            with open(path + '.tmp', 'w') as file:
+                file.write('Trade Date,')
+            # the complete journal is redone, the torn one is dropped
+            size = os.path.getsize(path)
+            with open(path + '.journal', 'wb') as file:
+                file.write(b'{"offset": %d, "size": 21, "sha1": "x"}\n2021-02-02' % size)
+            self.assertEqual(2, len(recover_interrupted_writes(tmp_path)))
+            self.assertEqual(['GVZ.csv'], os.listdir(tmp_path))
+            self.assertEqual(size, os.path.getsize(path))
+            data = b'2021-02-02,1,0,1,1,1\n'
+            with open(path + '.journal', 'wb') as file:
+                file.write(b'{"offset": %d, "size": %d, "sha1": "%s"}\n' %
+                           (size, len(data), hashlib.sha1(data).hexdigest().encode()))
+                file.write(data)
+            recover_interrupted_writes(tmp_path)
+            self.assertEqual('2021-02-02', read_last_index(path))
+            self.assertEqual(['GVZ.csv'], os.listdir(tmp_path))
+        finally:
+            shutil.rmtree(tmp_path)
+
+    #----------------------------------------------------------------------
+    def testConcurrentAtomicWrites(self):
+        """the concurrent writers of the same file never share the temp file"""
+        tmp_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_path, 'calendar.json')
+            barrier = threading.Barrier(2)
+            def write(content):
+                def write_tmp(tmp_path):
+                    barrier.wait(timeout = 5)
+                    with open(tmp_path, 'w') as file:
+                        file.write(content)
+                    barrier.wait(timeout = 5)
+                atomic_write(path, write_tmp)
+            threads = [threading.Thread(target = write, args = (content, ))
+                       for content in ['a' * 1000, 'b' * 1000]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with open(path, 'r') as file:
+                self.assertIn(file.read(), ['a' * 1000, 'b' * 1000])
+            self.assertEqual(['calendar.json'], os.listdir(tmp_path))
+            self.assertEqual(0o644, stat.S_IMODE(os.stat(path).st_mode))
+        finally:
+            shutil.rmtree(tmp_path)
+
     #----------------------------------------------------------------------
     def testGenerateChecksums(self):
         """"""
@@ -44,6 +137,28 @@ class TestUnititiesCase(ut.TestCase):
         self.assertEqual([('2013-01-16.csv', '5177dab14a912f774a8478bfbefb9e4100023c45'),
                           ('2020-08-19.csv', '8b5b795edfea70bba2c183e6b198c769ea4dd8cb')], sorted(ret))
 
+    #----------------------------------------------------------------------
+    def testFingerprintCache(self):
+        """the file is hashed again only if it's changed"""
+        cache = FingerprintCache()
+        calls = []
+        def calc(path):
+            calls.append(path)
+            return hash_file(path)
+        fd, path = tempfile.mkstemp(suffix = '.csv')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write('a')
+            checksum = cache.get(path, calc)
+            self.assertEqual(checksum, cache.get(path, calc))
+            self.assertEqual(1, len(calls))
+            with open(path, 'w') as file:
+                file.write('ab')
+            self.assertNotEqual(checksum, cache.get(path, calc))
+            self.assertEqual(2, len(calls))
+        finally:
+            os.remove(path)
+
     #----------------------------------------------------------------------
     def testRunOverTimeFrame(self):
         """test for generating the delivery date"""
@@ -77,6 +192,76 @@ class TestUnititiesCase(ut.TestCase):
         self.assertEqual('2020-10-21', seq[93])
         self.assertEqual('2020-11-18', seq[94])
         self.assertEqual('2020-12-16', seq[95])
+        # good friday is not a business day
+        self.assertEqual(False, is_business_day('2014-04-18', days))
+        self.assertEqual(True, is_business_day('2014-04-17', days))
+
+    #----------------------------------------------------------------------
+    def testTradingCalendarReadOnly(self):
+        """the lookups never write the calendar"""
+        data_root = tempfile.mkdtemp()
+        set_data_root(data_root)
+        try:
+            calendar = get_trading_calendar()
+            self.assertIs(calendar, get_trading_calendar())
+            self.assertEqual(False, os.path.exists(get_file_path(CALENDAR_FILE)))
+        finally:
+            set_data_root(self.data_root)
+            shutil.rmtree(data_root)
+
+    #----------------------------------------------------------------------
+    def testHolidaysStale(self):
+        """the recent and future holidays are checked again once a day"""
+        today = datetime(2021, 1, 4).date()
+        holidays = calc_holidays(datetime(2020, 11, 1).date(), datetime(2021, 3, 1).date())
+        calendar = {'holidays': holidays, 'holidays_end': '2021-03-01'}
+        self.assertEqual(False, is_holidays_stale(calendar, today))
+        # the closure added to the source calendar later
+        calendar['holidays'] = [day for day in holidays if day != '2021-02-15']
+        self.assertEqual(True, is_holidays_stale(calendar, today))
+        calendar['holidays_checked'] = '2021-01-04'
+        self.assertEqual(False, is_holidays_stale(calendar, today))
+
+    #----------------------------------------------------------------------
+    def testExpirationDate(self):
+        """test for the closed form expiration date"""
+        self.assertEqual('2020-09-18', third_friday(2020, 9).strftime(DATE_FORMAT))
+        self.assertEqual('2020-05-15', third_friday(2020, 5).strftime(DATE_FORMAT))
+        self.assertEqual('2020-09-16', calc_expiration_date(2020, 10, TradingCalendar()))
+        # the 3rd friday is good friday, move back to thursday
+        self.assertEqual('2014-03-18', calc_expiration_date(2014, 4, TradingCalendar(['2014-04-18'])))
+
+    #----------------------------------------------------------------------
+    def testTradingCalendar(self):
+        """test for the business day lookups"""
+        calendar = TradingCalendar(['2021-02-15'])
+        self.assertEqual(False, is_business_day('2021-02-15', calendar))
+        self.assertEqual(False, is_business_day(datetime(2021, 2, 13), calendar))
+        self.assertEqual(True, is_business_day('2021-02-16', calendar))
+        self.assertEqual(np.datetime64('2021-02-12'), calendar.previous_day('2021-02-16'))
+        self.assertEqual(np.datetime64('2021-02-12'), calendar.previous_day('2021-02-15'))
+        self.assertEqual(np.datetime64('2021-02-16'), calendar.next_day('2021-02-12'))
+        self.assertEqual(np.datetime64('2021-02-12'), calendar.rollback('2021-02-15'))
+        np.testing.assert_array_equal(
+            np.array(['2021-02-11', '2021-02-12', '2021-02-16'], dtype = 'datetime64[D]'),
+            calendar.last_n_days(3, '2021-02-16'))
+
+    #----------------------------------------------------------------------
+    def testCfeSession(self):
+        """the cfe sessions are from the evening before to the afternoon"""
+        calendar = TradingCalendar(['2021-02-15'])
+        # friday 15:30 chicago time
+        current = datetime(2021, 2, 12, 21, 30, tzinfo = timezone.utc)
+        open_time, close_time = get_cfe_session(current, calendar)
+        self.assertEqual(pd.Timestamp('2021-02-11 17:00', tz = 'America/Chicago'), open_time)
+        self.assertEqual(pd.Timestamp('2021-02-12 16:00', tz = 'America/Chicago'), close_time)
+        self.assertEqual(0, get_cfe_closed_delay(calendar, current))
+        # closed after friday's session until the evening of the holiday
+        current = datetime(2021, 2, 12, 22, 30, tzinfo = timezone.utc)
+        open_time, close_time = get_cfe_session(current, calendar)
+        self.assertEqual(pd.Timestamp('2021-02-15 17:00', tz = 'America/Chicago'), open_time)
+        self.assertEqual(3600 * 72.5, get_cfe_closed_delay(calendar, current))
+        self.assertEqual(0, get_cfe_closed_delay(calendar, datetime(2021, 2, 15, 23, 1, tzinfo = timezone.utc)))
 
     #----------------------------------------------------------------------
     def testFuturesChain(self):
@@ -112,6 +297,36 @@ class TestUnititiesCase(ut.TestCase):
         today_str = '2021-02-16'
         self.assertEqual(today_str, recent[-1])
         self.assertEqual(False, '2021-02-15' in recent)
+        # the shared context computes the same days once
+        calendar = TradingCalendar(['2021-02-15'])
+        context = TradingDayContext(calendar, current)
+        self.assertEqual(calendar, context.calendar)
+        self.assertEqual(list(get_recent_trading_days(current = current, calendar = calendar)),
+                         list(context.recent_days))
+
+    #----------------------------------------------------------------------
+    def testRollingPercentDistribution(self):
+        """the streaming percentage is the same as the rolling apply"""
+        gvz = load_vix_by_csv(os.path.join(TEST_DATA_ROOT, 'GVZ.csv'))
+        close = gvz.Close.iloc[-1200:].copy()
+        close.iloc[100] = np.nan
+        expected = close.rolling(HV_DISTRIBUTION_PERIODS).apply(percent_distribution)
+        pd.testing.assert_series_equal(expected, rolling_percent_distribution(close))
+
+    #----------------------------------------------------------------------
+    def testHistoricalMaxMinPer(self):
+        """the extend mode is the same as a full calculation"""
+        gvz = load_vix_by_csv(os.path.join(TEST_DATA_ROOT, 'GVZ.csv'))
+        full = gvz.copy()
+        historical_max_min_per(full)
+        self.assertEqual(100, full.mper.iloc[0])
+        self.assertEqual(gvz.Close.max(), full.Max.iloc[-1])
+        self.assertEqual(gvz.Close.min(), full.Min.iloc[-1])
+        part = gvz.iloc[:-5].copy()
+        historical_max_min_per(part)
+        part = pd.concat([part, gvz.iloc[-5:]])
+        historical_max_min_per(part, part.shape[0] - 5)
+        pd.testing.assert_frame_equal(full, part, check_dtype = False)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,84 @@
+# encoding: UTF-8
+
+import unittest as ut
+import copy
+import numpy as np
+from cboe_monitor.util_cboe_vix_futures import \
+    check_vix_intraday_warning, VixIntradayState, calc_intraday_ratio, \
+    get_intraday_delay, INTRADAY_POLL_DELAY, batch_check_vix_intraday_warning
+
+
+#----------------------------------------------------------------------
+def mk_item(symbol: str, prev: float, high: float, low: float, last: float, volume: str = '1000'):
+    """the quote item of the payload"""
+    return {'symbol': symbol, 'prev_settlement': str(prev), 'high': str(high),
+            'low': str(low), 'last_price': str(last), 'volume': volume}
+
+
+#----------------------------------------------------------------------
+def make_payload(size: int, seed: int = 0):
+    """the synthetic quotes of size contracts, some of them are unusual"""
+    rng = np.random.default_rng(seed)
+    prevs = np.round(rng.uniform(15, 40, size), 2)
+    highs = np.round(prevs + rng.uniform(0, 8, size), 2)
+    lows = np.round(prevs - rng.uniform(0, 8, size), 2)
+    lasts = np.round(rng.uniform(lows, highs), 2)
+    volumes = rng.integers(0, 500, size)
+    items = [mk_item(f'VX/{idx}', prev, high, low, last,
+                     '-' if 0 == idx % 7 else str(volume))
+             for idx, (prev, high, low, last, volume) in
+             enumerate(zip(prevs.tolist(), highs.tolist(), lows.tolist(),
+                           lasts.tolist(), volumes.tolist()))]
+    return {'data': items}
+
+
+#----------------------------------------------------------------------
+class TestVixFutures(ut.TestCase):
+
+    def testBatchWarning(self):
+        """the same states as the loop, the input is not changed"""
+        for test in [False, True]:
+            rets = make_payload(500, 1)
+            expected = check_vix_intraday_warning(copy.deepcopy(rets), test)
+            self.assertNotEqual([], expected)
+            before = copy.deepcopy(rets)
+            self.assertEqual(expected, batch_check_vix_intraday_warning(rets, test))
+            self.assertEqual(before, rets)
+        self.assertEqual([], batch_check_vix_intraday_warning({'data': []}))
+        self.assertEqual(0, calc_intraday_ratio({'data': []}))
+
+    def testManyContracts(self):
+        """the loop and the masks of many contracts"""
+        rets = make_payload(5000)
+        expected = check_vix_intraday_warning(copy.deepcopy(rets))
+        self.assertEqual(expected, batch_check_vix_intraday_warning(rets))
+
+    def testUnparsedVolume(self):
+        """the contracts of the unparsed volume are logged"""
+        rets = {'data': [mk_item('VX/G1', 20, 30, 19.5, 29, '1,234'),
+                         mk_item('VX/H1', 22, 30, 22, 22, '-')]}
+        with self.assertLogs('cboe_monitor', level = 'WARNING') as cm:
+            self.assertEqual([], batch_check_vix_intraday_warning(rets))
+        self.assertEqual(1, len(cm.output))
+        self.assertIn('VX/G1', cm.output[0])
+        self.assertIn('1,234', cm.output[0])
+
+    def testIntradayRatio(self):
+        """the nearer to the unusual move the faster to poll"""
+        rets = {'data': [mk_item('VX/G1', 20, 21, 19.5, 20.5),
+                         mk_item('VX/H1', 22, 30, 22, 22, '-'),
+                         mk_item('VX/J1', 23, 23.5, 20, 20.5, '50')]}
+        self.assertAlmostEqual(0.2, calc_intraday_ratio(rets))
+        self.assertEqual(INTRADAY_POLL_DELAY, get_intraday_delay(calc_intraday_ratio(rets)))
+        rets['data'].append(mk_item('VX/K1', 24, 28.5, 24, 28))
+        self.assertAlmostEqual(0.9, calc_intraday_ratio(rets))
+        self.assertEqual(30, get_intraday_delay(calc_intraday_ratio(rets)))
+        self.assertEqual([], check_vix_intraday_warning(rets))
+        rets['data'].append(mk_item('VX/M1', 25, 30, 25, 26))
+        infos = check_vix_intraday_warning(rets)
+        self.assertEqual([(VixIntradayState.PinUp, 'VX/M1')],
+                         [(state, item['symbol']) for state, item in infos])
+
+
+if __name__ == '__main__':
+    ut.main()